@@ -1,13 +1,19 @@
 from enum import Enum
 from http import HTTPStatus
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
-from src.constants import SortOrder
-from src.models.film import Film
+from src.constants import ListView, SortOrder
+from src.core import config
+from src.core.deadline import request_deadline
+from src.models.batch import BatchItem, BatchRequest
+from src.models.film import Film, FilmSummary
+from src.models.page import FacetedPage
+from src.services.base import Page
 from src.services.film import FilmService, get_film_service
-from src.utils import cached
+from src.utils import cached, cached_batch, decode_cursor, keyset_sort, ndjson_stream
 
 router = APIRouter(
     prefix="/films",
@@ -24,19 +30,94 @@ class SortFieldFilm(str, Enum):
         return value in cls._value2member_map_
 
 
+def film_facets() -> dict:
+    """Film list facets, counted by the same search request as the hits.
+
+    Fields are those of the dynamic mapping: ``type`` is text with a ``keyword`` subfield.
+    """
+    genre = {"terms": {"field": "genres.id", "size": 100}}
+    if config.ES_FILM_GENRES_NESTED:
+        # Terms over nested documents only see them from inside a nested aggregation
+        genre = {"nested": {"path": "genres"}, "aggs": {"genre": genre}}
+    return {
+        "genre": genre,
+        "type": {"terms": {"field": "type.keyword"}},
+        "rating": {"histogram": {"field": "rating", "interval": 1, "min_doc_count": 1}},
+        "year": {
+            "date_histogram": {
+                "field": "creation_date",
+                "calendar_interval": "year",
+                "format": "yyyy",
+                "min_doc_count": 1,
+            }
+        },
+    }
+
+
+async def films_by_embedded_id(
+    path: str,
+    entity_id: str,
+    sort: SortFieldFilm,
+    sort_order: SortOrder,
+    limit: int,
+    cursor: Optional[str],
+    film_service: FilmService,
+) -> Page[FilmSummary]:
+    """Films whose embedded ``path`` list (people, genres) holds ``entity_id``, as summaries."""
+    sort_value = f"{SortFieldFilm.TITLE.value}.raw" if sort == SortFieldFilm.TITLE else sort.value
+    match = {"match": {f"{path}.id": {"query": entity_id, "operator": "and"}}}
+    es_query = {
+        "size": limit,
+        "from": 0,
+        "sort": keyset_sort(sort_value, sort_order.value),
+        "_source": list(FilmSummary.__fields__),
+        "query": {
+            "query": {
+                "bool": {
+                    # Matches the embedded list whether it is mapped as object or as nested
+                    "filter": {
+                        "bool": {
+                            "should": [
+                                match,
+                                {"nested": {"path": path, "query": match, "ignore_unmapped": True}},
+                            ],
+                            "minimum_should_match": 1,
+                        }
+                    }
+                }
+            }
+        },
+    }
+    if cursor:
+        es_query["search_after"] = decode_cursor(cursor, es_query["sort"])
+
+    return await film_service.list(es_query, FilmSummary)
+
+
 @router.get(
     "/",
-    response_model=list[Film],
+    dependencies=[Depends(request_deadline(config.LIST_DEADLINE))],
+    response_model=Union[list[Film], list[FilmSummary], FacetedPage[Film]],
     summary="Получение списка произведений",
-    response_description="Список произведений",
+    response_description="Список произведений; с facets=true — объект с total, items и facets",
+)
+@cached(
+    namespace="movies",
+    many=True,
+    ttl=config.FILMS_CACHE_TTL,
+    soft_ttl=config.FILMS_CACHE_SOFT_TTL,
+    max_age=config.FILMS_HTTP_MAX_AGE,
 )
-@cached(decoder=Film, many=True)
 async def film_list(
     search_query: Optional[str] = "",
     sort_order: SortOrder = SortOrder.ASC,
     sort: SortFieldFilm = SortFieldFilm.ID,
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    facets: bool = False,
+    track_total_hits: bool = False,
+    view: ListView = ListView.FULL,
     film_service: FilmService = Depends(get_film_service),  # noqa B008
 ) -> list[Film]:
     sort_value = sort.value
@@ -46,7 +127,7 @@ async def film_list(
     es_query = {
         "size": limit,
         "from": (page - 1) * limit,
-        "sort": [f"{sort_value}:{sort_order.value}"],
+        "sort": keyset_sort(sort_value, sort_order.value),
         "_source": [
             "id",
             "title",
@@ -61,6 +142,20 @@ async def film_list(
             "file_path",
         ],
     }
+    model = Film
+    if view == ListView.SUMMARY:
+        # Browse pages skip the embedded genres and people, the bulk of every hit
+        model = FilmSummary
+        es_query["_source"] = list(FilmSummary.__fields__)
+
+    if cursor:
+        es_query["from"] = 0
+        es_query["search_after"] = decode_cursor(cursor, es_query["sort"])
+
+    if facets:
+        es_query["aggs"] = film_facets()
+    if track_total_hits:
+        es_query["track_total_hits"] = True
 
     if search_query:
         es_query["query"] = {
@@ -80,19 +175,69 @@ async def film_list(
             }
         }
 
-    return await film_service.list(es_query)
+    return await film_service.list(es_query, model)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    summary="Выгрузка всего каталога произведений",
+    response_description="Поток NDJSON, по одному произведению на строку",
+)
+async def film_export(
+    request: Request,
+    fields: Optional[str] = None,
+    film_service: FilmService = Depends(get_film_service),  # noqa B008
+) -> StreamingResponse:
+    source = list(Film.__fields__)
+    if fields:
+        source = [field.strip() for field in fields.split(",") if field.strip()]
+        if unknown := [field for field in source if field not in Film.__fields__]:
+            raise HTTPException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=f"unknown fields: {', '.join(unknown)}"
+            )
+
+    es_query = {"size": config.EXPORT_BATCH_SIZE, "sort": ["id:asc"], "_source": source}
+
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"} if compress else {"Vary": "Accept-Encoding"}
+    return StreamingResponse(
+        ndjson_stream(film_service.export(es_query), compress), media_type="application/x-ndjson", headers=headers
+    )
 
 
 @router.get(
     "/{film_id}",
+    dependencies=[Depends(request_deadline(config.DETAILS_DEADLINE))],
     response_model=Film,
     summary="Получение информации о конкретном произведении",
     response_description="Информация о конкретном произведении",
 )
-@cached(decoder=Film)
+@cached(
+    namespace="movies",
+    ttl=config.FILMS_CACHE_TTL,
+    soft_ttl=config.FILMS_CACHE_SOFT_TTL,
+    max_age=config.FILMS_HTTP_MAX_AGE,
+)
 async def film_details(film_id: str, film_service: FilmService = Depends(get_film_service)) -> Film:  # noqa B008
     film = await film_service.get(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="film not found")
 
     return film
+
+
+@router.post(
+    "/batch",
+    dependencies=[Depends(request_deadline(config.BATCH_DEADLINE))],
+    response_model=list[BatchItem[Film]],
+    summary="Получение информации о нескольких произведениях по списку id",
+    response_description="Список в порядке запроса, ненайденные id помечены found=false",
+)
+async def film_batch(
+    batch: BatchRequest,
+    film_service: FilmService = Depends(get_film_service),  # noqa B008
+):
+    return await cached_batch(
+        "movies", batch.ids, film_service, ttl=config.FILMS_CACHE_TTL, soft_ttl=config.FILMS_CACHE_SOFT_TTL
+    )
@@ -1,13 +1,19 @@
 from enum import Enum
 from http import HTTPStatus
-from typing import Optional
+from typing import Optional, Union
 
 from fastapi import APIRouter, Depends, HTTPException
 
-from src.constants import SortOrder
-from src.models.genre import Genre
+from src.api.v1.film import SortFieldFilm, films_by_embedded_id
+from src.constants import ListView, SortOrder
+from src.core import config
+from src.core.deadline import request_deadline
+from src.models.batch import BatchItem, BatchRequest
+from src.models.film import FilmSummary
+from src.models.genre import Genre, GenreSummary
+from src.services.film import FilmService, get_film_service
 from src.services.genre import GenreService, get_genre_service
-from src.utils import cached
+from src.utils import cached, cached_batch, decode_cursor, keyset_sort
 
 router = APIRouter(
     prefix="/genres",
@@ -23,19 +29,34 @@ class SortFieldGenre(str, Enum):
         return value in cls._value2member_map_
 
 
+def served_from_catalog(kwargs: dict) -> bool:
+    # The in-memory catalog answers faster than the shared cache would
+    return kwargs["genre_service"].local
+
+
 @router.get(
     "/",
-    response_model=list[Genre],
+    dependencies=[Depends(request_deadline(config.LIST_DEADLINE))],
+    response_model=Union[list[Genre], list[GenreSummary]],
     summary="Получение списка жанров",
     response_description="Список жанров",
 )
-@cached(decoder=Genre)
+@cached(
+    namespace="genres",
+    many=True,
+    ttl=config.GENRES_CACHE_TTL,
+    soft_ttl=config.GENRES_CACHE_SOFT_TTL,
+    max_age=config.GENRES_HTTP_MAX_AGE,
+    bypass=served_from_catalog,
+)
 async def genre_list(
     search_query: Optional[str] = "",
     sort_order: SortOrder = SortOrder.ASC,
     sort: SortFieldGenre = SortFieldGenre.ID,
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    view: ListView = ListView.FULL,
     genre_service: GenreService = Depends(get_genre_service),  # noqa B008
 ) -> list[Genre]:
     sort_value = sort.value
@@ -45,9 +66,22 @@ async def genre_list(
     es_query = {
         "size": limit,
         "from": (page - 1) * limit,
-        "sort": [f"{sort_value}:{sort_order.value}"],
-        "_source": ["id", "genre"],
+        "sort": keyset_sort(sort_value, sort_order.value),
+        "_source": ["id", "genre", "created", "modified"],
     }
+    model = Genre
+    if view == ListView.SUMMARY:
+        model = GenreSummary
+        es_query["_source"] = list(GenreSummary.__fields__)
+
+    if cursor:
+        es_query["from"] = 0
+        es_query["search_after"] = decode_cursor(cursor, es_query["sort"])
+
+    if genre_service.local:
+        return genre_service.catalog.list(
+            search_query, es_query["sort"], es_query.get("search_after"), es_query["from"], limit, model
+        )
 
     if search_query:
         es_query["query"] = {
@@ -60,19 +94,73 @@ async def genre_list(
             }
         }
 
-    return await genre_service.list(es_query)
+    return await genre_service.list(es_query, model)
 
 
 @router.get(
     "/{genre_id}",
+    dependencies=[Depends(request_deadline(config.DETAILS_DEADLINE))],
     response_model=Genre,
     summary="Получение информации о конкретном жанре",
     response_description="Информация о конкретном жанре",
 )
-@cached(decoder=Genre)
+@cached(
+    namespace="genres",
+    ttl=config.GENRES_CACHE_TTL,
+    soft_ttl=config.GENRES_CACHE_SOFT_TTL,
+    max_age=config.GENRES_HTTP_MAX_AGE,
+    bypass=served_from_catalog,
+)
 async def genre_details(genre_id: str, genre_service: GenreService = Depends(get_genre_service)) -> Genre:  # noqa B008
     genre = await genre_service.get(genre_id)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genre not found")
 
     return genre
+
+
+@router.get(
+    "/{genre_id}/films",
+    dependencies=[Depends(request_deadline(config.LIST_DEADLINE))],
+    response_model=list[FilmSummary],
+    summary="Получение списка произведений жанра",
+    response_description="Краткая информация о произведениях, постраничная выдача по cursor",
+)
+@cached(
+    namespace="movies",
+    many=True,
+    ttl=config.FILMS_CACHE_TTL,
+    soft_ttl=config.FILMS_CACHE_SOFT_TTL,
+    max_age=config.FILMS_HTTP_MAX_AGE,
+)
+async def genre_films(
+    genre_id: str,
+    sort_order: SortOrder = SortOrder.ASC,
+    sort: SortFieldFilm = SortFieldFilm.ID,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    film_service: FilmService = Depends(get_film_service),  # noqa B008
+) -> list[FilmSummary]:
+    return await films_by_embedded_id("genres", genre_id, sort, sort_order, limit, cursor, film_service)
+
+
+@router.post(
+    "/batch",
+    dependencies=[Depends(request_deadline(config.BATCH_DEADLINE))],
+    response_model=list[BatchItem[Genre]],
+    summary="Получение информации о нескольких жанрах по списку id",
+    response_description="Список в порядке запроса, ненайденные id помечены found=false",
+)
+async def genre_batch(
+    batch: BatchRequest,
+    genre_service: GenreService = Depends(get_genre_service),  # noqa B008
+):
+    if genre_service.local:
+        genres = genre_service.catalog.get_many(batch.ids)
+        return [
+            BatchItem[Genre](id=genre_id, found=genre is not None, data=genre)
+            for genre_id, genre in zip(batch.ids, genres)
+        ]
+    return await cached_batch(
+        "genres", batch.ids, genre_service, ttl=config.GENRES_CACHE_TTL, soft_ttl=config.GENRES_CACHE_SOFT_TTL
+    )
@@ -1,13 +1,19 @@
 from enum import Enum
 from http import HTTPStatus
-from typing import Optional
+from typing import Optional, Union
 
 from fastapi import APIRouter, Depends, HTTPException
 
-from src.constants import SortOrder
-from src.models.person import Person
+from src.api.v1.film import SortFieldFilm, films_by_embedded_id
+from src.constants import ListView, SortOrder
+from src.core import config
+from src.core.deadline import request_deadline
+from src.models.batch import BatchItem, BatchRequest
+from src.models.film import FilmSummary
+from src.models.person import Person, PersonSummary
+from src.services.film import FilmService, get_film_service
 from src.services.person import PersonService, get_person_service
-from src.utils import cached
+from src.utils import cached, cached_batch, decode_cursor, keyset_sort
 
 router = APIRouter(
     prefix="/people",
@@ -26,17 +32,26 @@ class SortFieldPerson(str, Enum):
 
 @router.get(
     "/",
-    response_model=list[Person],
+    dependencies=[Depends(request_deadline(config.LIST_DEADLINE))],
+    response_model=Union[list[Person], list[PersonSummary]],
     summary="Получение списка участников в произведении",
     response_description="Список участников в произведении",
 )
-@cached(decoder=Person)
+@cached(
+    namespace="people",
+    many=True,
+    ttl=config.PEOPLE_CACHE_TTL,
+    soft_ttl=config.PEOPLE_CACHE_SOFT_TTL,
+    max_age=config.PEOPLE_HTTP_MAX_AGE,
+)
 async def people_list(
     search_query: Optional[str] = "",
     sort_order: SortOrder = SortOrder.ASC,
     sort: SortFieldPerson = SortFieldPerson.ID,
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    view: ListView = ListView.FULL,
     person_service: PersonService = Depends(get_person_service),  # noqa B008
 ) -> list[Person]:
     sort_value = sort.value
@@ -49,9 +64,17 @@ async def people_list(
     es_query = {
         "size": limit,
         "from": (page - 1) * limit,
-        "sort": [f"{sort_value}:{sort_order.value}"],
-        "_source": ["id", "first_name", "last_name", "birth_date"],
+        "sort": keyset_sort(sort_value, sort_order.value),
+        "_source": ["id", "first_name", "last_name", "birth_date", "created", "modified"],
     }
+    model = Person
+    if view == ListView.SUMMARY:
+        model = PersonSummary
+        es_query["_source"] = list(PersonSummary.__fields__)
+
+    if cursor:
+        es_query["from"] = 0
+        es_query["search_after"] = decode_cursor(cursor, es_query["sort"])
 
     if search_query:
         es_query["query"] = {
@@ -64,16 +87,22 @@ async def people_list(
             }
         }
 
-    return await person_service.list(es_query)
+    return await person_service.list(es_query, model)
 
 
 @router.get(
     "/{person_id}",
+    dependencies=[Depends(request_deadline(config.DETAILS_DEADLINE))],
     response_model=Person,
     summary="Получение информации о конкретной личности",
     response_description="Информация о конкретной личности",
 )
-@cached(decoder=Person)
+@cached(
+    namespace="people",
+    ttl=config.PEOPLE_CACHE_TTL,
+    soft_ttl=config.PEOPLE_CACHE_SOFT_TTL,
+    max_age=config.PEOPLE_HTTP_MAX_AGE,
+)
 async def person_details(
     person_id: str,
     person_service: PersonService = Depends(get_person_service),  # noqa B008
@@ -83,3 +112,44 @@ async def person_details(
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="person not found")
 
     return person
+
+
+@router.get(
+    "/{person_id}/films",
+    dependencies=[Depends(request_deadline(config.LIST_DEADLINE))],
+    response_model=list[FilmSummary],
+    summary="Получение списка произведений с участием личности",
+    response_description="Краткая информация о произведениях, постраничная выдача по cursor",
+)
+@cached(
+    namespace="movies",
+    many=True,
+    ttl=config.FILMS_CACHE_TTL,
+    soft_ttl=config.FILMS_CACHE_SOFT_TTL,
+    max_age=config.FILMS_HTTP_MAX_AGE,
+)
+async def person_films(
+    person_id: str,
+    sort_order: SortOrder = SortOrder.ASC,
+    sort: SortFieldFilm = SortFieldFilm.ID,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    film_service: FilmService = Depends(get_film_service),  # noqa B008
+) -> list[FilmSummary]:
+    return await films_by_embedded_id("people", person_id, sort, sort_order, limit, cursor, film_service)
+
+
+@router.post(
+    "/batch",
+    dependencies=[Depends(request_deadline(config.BATCH_DEADLINE))],
+    response_model=list[BatchItem[Person]],
+    summary="Получение информации о нескольких личностях по списку id",
+    response_description="Список в порядке запроса, ненайденные id помечены found=false",
+)
+async def person_batch(
+    batch: BatchRequest,
+    person_service: PersonService = Depends(get_person_service),  # noqa B008
+):
+    return await cached_batch(
+        "people", batch.ids, person_service, ttl=config.PEOPLE_CACHE_TTL, soft_ttl=config.PEOPLE_CACHE_SOFT_TTL
+    )
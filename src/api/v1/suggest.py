@@ -0,0 +1,84 @@
+import orjson
+from fastapi import APIRouter, Depends, Query, Response
+
+from src.core import config
+from src.core.deadline import request_deadline
+from src.models.suggest import Suggestion
+from src.services.base_cache import CacheEntry, InMemoryCache
+from src.services.cache_keys import normalize_param
+from src.services.suggest import SuggestService, get_suggest_service
+from src.utils import count_cache, json_response, single_flight
+
+router = APIRouter(
+    prefix="/suggest",
+)
+
+# Short prefixes (1-3 characters) repeat the most, so they are kept in process memory
+prefix_cache = InMemoryCache(config.SUGGEST_CACHE_MAX_ENTRIES, config.SUGGEST_CACHE_MAX_BYTES, config.SUGGEST_CACHE_TTL)
+
+# Fields matched per index: film documents carry a flat genre field too, which must not
+# turn every film of a genre into a suggestion
+SUGGEST_FIELDS = {
+    "movies": ["title"],
+    "genres": ["genre"],
+    "people": ["first_name", "last_name"],
+}
+
+
+@router.get(
+    "/",
+    dependencies=[Depends(request_deadline(config.SUGGEST_DEADLINE))],
+    response_model=list[Suggestion],
+    summary="Подсказки при наборе поискового запроса",
+    response_description="Произведения, жанры и люди, название или имя которых начинается с запроса",
+)
+async def suggest(
+    query: str = Query(..., min_length=1, max_length=100),  # noqa B008
+    limit: int = Query(config.SUGGEST_SIZE, ge=1, le=config.SUGGEST_MAX_SIZE),  # noqa B008
+    suggest_service: SuggestService = Depends(get_suggest_service),  # noqa B008
+) -> Response:
+    prefix = normalize_param("query", query)
+    es_query = {
+        "size": limit,
+        "from": 0,
+        "sort": ["_score:desc"],
+        "_source": ["id", "title", "genre", "first_name", "last_name"],
+        "query": {
+            "query": {
+                "bool": {
+                    "should": [
+                        {
+                            "bool": {
+                                "filter": {"term": {"_index": index}},
+                                "must": {"multi_match": {"query": prefix, "type": "bool_prefix", "fields": fields}},
+                            }
+                        }
+                        for index, fields in SUGGEST_FIELDS.items()
+                    ]
+                }
+            }
+        },
+    }
+
+    async def load() -> CacheEntry:
+        suggestions = await suggest_service.list(es_query)
+        return CacheEntry.create(orjson.dumps([suggestion.dict() for suggestion in suggestions]))
+
+    headers = {"Cache-Control": f"public, max-age={config.SUGGEST_HTTP_MAX_AGE}"}
+    if len(prefix) > config.SUGGEST_CACHE_PREFIX_LENGTH:
+        return json_response((await load()).data, headers)
+
+    cache_key = f"{prefix}:{limit}"
+    if (entry := await prefix_cache.get_entry(cache_key)) is not None:
+        count_cache("suggest", "hit")
+        return json_response(entry.data, headers)
+
+    count_cache("suggest", "miss")
+
+    async def load_and_cache() -> CacheEntry:
+        entry = await load()
+        await prefix_cache.set_entry(cache_key, entry, config.SUGGEST_CACHE_TTL)
+        return entry
+
+    entry = await single_flight.do(f"suggest:{cache_key}", load_and_cache)
+    return json_response(entry.data, headers)
@@ -4,3 +4,8 @@ from enum import Enum
 class SortOrder(str, Enum):
     ASC = "asc"
     DESC = "desc"
+
+
+class ListView(str, Enum):
+    FULL = "full"
+    SUMMARY = "summary"
@@ -4,12 +4,148 @@ PROJECT_NAME = os.getenv("PROJECT_NAME", "movies")
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+# Пул соединений Redis на воркер. Команды мультиплексируются по свободным соединениям,
+# соединение занимается целиком только конвейером (pipeline) или транзакцией; ждать такое
+# соединение могут не более REDIS_POOL_MAX_WAITERS запросов, остальные сразу идут мимо кеша
+REDIS_POOL_MINSIZE = int(os.getenv("REDIS_POOL_MINSIZE", 10))
+REDIS_POOL_MAXSIZE = int(os.getenv("REDIS_POOL_MAXSIZE", 20))
+REDIS_POOL_MAX_WAITERS = int(os.getenv("REDIS_POOL_MAX_WAITERS", 100))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1))
+# Таймаут ответа на операцию кеша (секунды), 0 отключает
+REDIS_READ_TIMEOUT = float(os.getenv("REDIS_READ_TIMEOUT", 0.5))
 
 ELASTIC_HOST = os.getenv("ELASTIC_HOST", "es01")
 ELASTIC_PORT = int(os.getenv("ELASTIC_PORT", 9200))
+# Узлы кластера через запятую; по умолчанию единственный ELASTIC_HOST:ELASTIC_PORT
+ELASTIC_HOSTS = os.getenv("ELASTIC_HOSTS", f"{ELASTIC_HOST}:{ELASTIC_PORT}")
+# Сокетов на узел на воркер, сверх них запросы ждут свободного; keepalive простаивающего сокета (секунды)
+ES_MAXSIZE = int(os.getenv("ES_MAXSIZE", 25))
+ES_KEEPALIVE = float(os.getenv("ES_KEEPALIVE", 30))
+# gzip запросов и ответов: меньше трафика ценой CPU на обеих сторонах
+ES_HTTP_COMPRESS = os.getenv("ES_HTTP_COMPRESS", "false").lower() == "true"
+# Обнаружение узлов кластера (sniffing): при старте, после отказа узла и раз в ES_SNIFF_INTERVAL
+# секунд (0 — не обновлять). Недоступный узел исключается на ES_DEAD_TIMEOUT секунд (растёт при повторах)
+ES_SNIFF_ON_START = os.getenv("ES_SNIFF_ON_START", "false").lower() == "true"
+ES_SNIFF_ON_CONNECTION_FAIL = os.getenv("ES_SNIFF_ON_CONNECTION_FAIL", "false").lower() == "true"
+ES_SNIFF_INTERVAL = float(os.getenv("ES_SNIFF_INTERVAL", 0))
+ES_SNIFF_TIMEOUT = float(os.getenv("ES_SNIFF_TIMEOUT", 0.5))
+ES_DEAD_TIMEOUT = float(os.getenv("ES_DEAD_TIMEOUT", 30))
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 CACHE_TTL = int(os.getenv("CACHE_TTL", 60 * 5))  # 5 минут
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "v1")
+# Сколько секунд воркер доверяет прочитанному номеру поколения списков
+CACHE_GENERATION_TTL = float(os.getenv("CACHE_GENERATION_TTL", 1))
+
+# Жёсткий TTL записи в Redis и мягкий срок, после которого значение отдаётся как устаревшее
+# и обновляется в фоне (stale-while-revalidate). SOFT_TTL = 0 отключает фоновое обновление.
+FILMS_CACHE_TTL = int(os.getenv("FILMS_CACHE_TTL", CACHE_TTL * 2))
+FILMS_CACHE_SOFT_TTL = int(os.getenv("FILMS_CACHE_SOFT_TTL", CACHE_TTL))
+GENRES_CACHE_TTL = int(os.getenv("GENRES_CACHE_TTL", CACHE_TTL * 2))
+GENRES_CACHE_SOFT_TTL = int(os.getenv("GENRES_CACHE_SOFT_TTL", CACHE_TTL))
+PEOPLE_CACHE_TTL = int(os.getenv("PEOPLE_CACHE_TTL", CACHE_TTL * 2))
+PEOPLE_CACHE_SOFT_TTL = int(os.getenv("PEOPLE_CACHE_SOFT_TTL", CACHE_TTL))
+
+# Cache-Control: max-age ответов для клиентов и nginx, 0 — заголовок не отдаётся
+FILMS_HTTP_MAX_AGE = int(os.getenv("FILMS_HTTP_MAX_AGE", 60))
+GENRES_HTTP_MAX_AGE = int(os.getenv("GENRES_HTTP_MAX_AGE", 60 * 10))
+PEOPLE_HTTP_MAX_AGE = int(os.getenv("PEOPLE_HTTP_MAX_AGE", 60))
+
+LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 30))
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", 10_000))
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 64 Мб
+
+# Сжатие значений в Redis: zlib, lz4 (если установлен пакет lz4) или none
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")
+CACHE_COMPRESSION_LEVEL = int(os.getenv("CACHE_COMPRESSION_LEVEL", 1))
+CACHE_COMPRESSION_MIN_BYTES = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", 4096))
+
+CACHE_LOCK_ENABLED = os.getenv("CACHE_LOCK_ENABLED", "false").lower() == "true"
+CACHE_LOCK_LEASE_MS = int(os.getenv("CACHE_LOCK_LEASE_MS", 3000))
+CACHE_LOCK_POLL_MS = int(os.getenv("CACHE_LOCK_POLL_MS", 50))
+
+# Circuit breaker хранилища (на индекс): доля ошибок за окно WINDOW секунд при не менее MIN_CALLS вызовов
+# открывает его на OPEN_SECONDS, затем HALF_OPEN_PROBES пробных запросов решают, закрыть ли снова
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 20))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", 10))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 5))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", 1))
+
+# Бюджет времени запроса (секунды) на все обращения к ES, включая повторы; 0 отключает
+LIST_DEADLINE = float(os.getenv("LIST_DEADLINE", 2))
+DETAILS_DEADLINE = float(os.getenv("DETAILS_DEADLINE", 1))
+BATCH_DEADLINE = float(os.getenv("BATCH_DEADLINE", 1.5))
+SUGGEST_DEADLINE = float(os.getenv("SUGGEST_DEADLINE", 0.5))
+
+# Хеджирование чтения документа по id: повторный запрос к другой копии шарда, если первый
+# не ответил за ES_HEDGE_PERCENTILE-й перцентиль задержки (но не раньше ES_HEDGE_MIN_DELAY секунд)
+ES_HEDGE_ENABLED = os.getenv("ES_HEDGE_ENABLED", "false").lower() == "true"
+ES_HEDGE_PERCENTILE = float(os.getenv("ES_HEDGE_PERCENTILE", 95))
+ES_HEDGE_MIN_DELAY = float(os.getenv("ES_HEDGE_MIN_DELAY", 0.02))
+ES_HEDGE_WINDOW = int(os.getenv("ES_HEDGE_WINDOW", 1000))
+
+# Прогрев кеша при старте: списки (пути с query string через ";") и карточки
+# WARMUP_TOP_FILMS лучших по рейтингу фильмов и их участников. Старт ждёт прогрев
+# не дольше WARMUP_BUDGET секунд, остаток догружается в фоне
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_LISTS = os.getenv("WARMUP_LISTS", "/films/;/films/?view=summary;/genres/;/people/")
+WARMUP_TOP_FILMS = int(os.getenv("WARMUP_TOP_FILMS", 200))
+WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", 100))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 4))
+WARMUP_BUDGET = float(os.getenv("WARMUP_BUDGET", 5))
+# Прогрев при старте выполняет один воркер из стартовавших вместе: он берёт блокировку в Redis
+# на WARMUP_LOCK_TTL секунд, остальные воркеры в это время прогрев пропускают
+WARMUP_LOCK_TTL = float(os.getenv("WARMUP_LOCK_TTL", 60))
+
+# Каталог жанров целиком в памяти процесса: обновление изменённых (по modified) раз в
+# REFRESH_INTERVAL секунд и полная перезагрузка (учитывает удаления) раз в RELOAD_INTERVAL
+GENRE_CATALOG_ENABLED = os.getenv("GENRE_CATALOG_ENABLED", "true").lower() == "true"
+GENRE_CATALOG_REFRESH_INTERVAL = float(os.getenv("GENRE_CATALOG_REFRESH_INTERVAL", 30))
+GENRE_CATALOG_RELOAD_INTERVAL = float(os.getenv("GENRE_CATALOG_RELOAD_INTERVAL", 60 * 10))
+GENRE_CATALOG_PAGE_SIZE = int(os.getenv("GENRE_CATALOG_PAGE_SIZE", 1000))
+
+# Журнал запросов дольше SLOW_REQUEST_THRESHOLD секунд (логгер slow_requests), 0 отключает
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", 1))
+# Профилирование запросов к ES (?profile=true) доступно только с заголовком X-Debug-Token,
+# равным PROFILE_TOKEN; пустой токен отключает профилирование
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# Полная валидация pydantic документов из ES вместо быстрого доверенного декодера (для отладки)
+STRICT_MODEL_VALIDATION = os.getenv("STRICT_MODEL_VALIDATION", "false").lower() == "true"
+
+# Контроль нагрузки на воркер: не более ADMISSION_MAX_IN_FLIGHT запросов одновременно, ещё до
+# ADMISSION_QUEUE_SIZE ждут места не дольше ADMISSION_QUEUE_TIMEOUT секунд, остальным сразу 503
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 100))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 200))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 0.5))
+# Ограничение частоты запросов клиента (по X-Real-IP от nginx): RATE запросов в секунду
+# с запасом BURST. Если Redis недоступен, запросы пропускаются
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 50))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 100))
+# Пути (префиксы через запятую), которые не ограничиваются ни по нагрузке, ни по частоте
+ADMISSION_EXEMPT_PATHS = os.getenv("ADMISSION_EXEMPT_PATHS", "/v1/smoke,/metrics")
+
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", 100))
+
+# Подсказки поиска: размер выдачи и кеш коротких префиксов в памяти процесса
+SUGGEST_SIZE = int(os.getenv("SUGGEST_SIZE", 10))
+SUGGEST_MAX_SIZE = int(os.getenv("SUGGEST_MAX_SIZE", 20))
+SUGGEST_CACHE_PREFIX_LENGTH = int(os.getenv("SUGGEST_CACHE_PREFIX_LENGTH", 3))
+SUGGEST_CACHE_MAX_ENTRIES = int(os.getenv("SUGGEST_CACHE_MAX_ENTRIES", 20_000))
+SUGGEST_CACHE_MAX_BYTES = int(os.getenv("SUGGEST_CACHE_MAX_BYTES", 16 * 1024 * 1024))  # 16 Мб
+SUGGEST_CACHE_TTL = int(os.getenv("SUGGEST_CACHE_TTL", 60 * 5))
+SUGGEST_HTTP_MAX_AGE = int(os.getenv("SUGGEST_HTTP_MAX_AGE", 60))
+
+# Список жанров в документах фильмов замаплен как nested (по умолчанию — динамический
+# маппинг, т. е. object); от этого зависит, как считается фасет по жанрам
+ES_FILM_GENRES_NESTED = os.getenv("ES_FILM_GENRES_NESTED", "false").lower() == "true"
+
+# Выгрузка каталога: документов на страницу ES (и на один кусок ответа) и время жизни point in time
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_PIT_KEEP_ALIVE = os.getenv("EXPORT_PIT_KEEP_ALIVE", "1m")
+EXPORT_COMPRESSION_LEVEL = int(os.getenv("EXPORT_COMPRESSION_LEVEL", 6))
 
 API_V1_PREFIX = "/v1"
@@ -0,0 +1,63 @@
+"""Per-request latency budget shared by every storage call the request makes.
+
+An endpoint dependency starts the clock; storage calls read what is left of it and pass it
+on as the client request timeout, and retries stop once it is spent. The budget lives in a
+context variable, so background tasks started by the request inherit it (see ``restart``).
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+_budget: ContextVar[Optional[float]] = ContextVar("deadline_budget", default=None)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, budget: Optional[float]):
+        super().__init__(budget)
+        self.budget = budget
+
+    def __str__(self) -> str:
+        return f"request deadline of {self.budget}s exceeded"
+
+
+def set_deadline(seconds: float):
+    """Starts a budget of ``seconds`` for the current context, 0 disables it."""
+    _budget.set(seconds or None)
+    _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def restart():
+    """Gives the current context a fresh budget of the same size.
+
+    Background revalidation runs in a copy of the request context, after the response and
+    so usually past the request deadline.
+    """
+    set_deadline(budget() or 0)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the budget, None when the request has no deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def budget() -> Optional[float]:
+    return _budget.get()
+
+
+def check() -> Optional[float]:
+    """Returns the remaining budget or raises DeadlineExceeded if it is spent."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(budget())
+    return left
+
+
+def request_deadline(seconds: float):
+    """Endpoint dependency that starts the request budget."""
+
+    async def start_deadline():
+        set_deadline(seconds)
+
+    return start_deadline
@@ -0,0 +1,230 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Instruments are plain counters guarded by the GIL: there is one event loop per worker,
+so recording a sample is a dict lookup and an addition.
+"""
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Samples = Iterable[tuple[tuple[str, ...], float]]
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._function: Optional[Callable[[], Samples]] = None
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def set_function(self, function: Callable[[], Samples]):
+        """Collects samples lazily at scrape time instead of on every event."""
+        self._function = function
+
+    @abstractmethod
+    def _new_child(self):
+        pass
+
+    def samples(self) -> Iterable[str]:
+        if self._function is not None:
+            for values, value in self._function():
+                yield f"{self.name}{_format_labels(self.labelnames, values)} {value}"
+        for values, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def samples(self) -> Iterable[str]:
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {child.sum}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(
+    Counter("http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+)
+HTTP_LATENCY = REGISTRY.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency by route", ("route", "method"))
+)
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge("http_requests_in_flight", "HTTP requests being processed"))
+HTTP_QUEUED = REGISTRY.register(Gauge("http_requests_queued", "HTTP requests waiting for an admission slot"))
+HTTP_SHED = REGISTRY.register(
+    Counter("http_requests_shed_total", "HTTP requests rejected with 503 by admission control", ("reason",))
+)
+RATE_LIMITED = REGISTRY.register(
+    Counter("rate_limited_requests_total", "HTTP requests rejected with 429 by the per-client rate limit")
+)
+RATE_LIMIT_ERRORS = REGISTRY.register(
+    Counter("rate_limit_errors_total", "Rate limit checks skipped because Redis failed")
+)
+
+CACHE_REQUESTS = REGISTRY.register(
+    Counter("cache_requests_total", "cached() lookups by namespace and outcome", ("namespace", "result"))
+)
+CACHE_TIER = REGISTRY.register(
+    Counter("cache_tier_operations_total", "Cache lookups per tier and outcome", ("tier", "result"))
+)
+CACHE_COMPRESSION_VALUES = REGISTRY.register(
+    Counter("cache_compression_values_total", "Redis cache values by codec outcome", ("result",))
+)
+CACHE_COMPRESSION_BYTES = REGISTRY.register(
+    Counter("cache_compression_bytes_total", "Size of compressed Redis cache values before and after", ("stage",))
+)
+CACHE_COMPRESSION_RATIO = REGISTRY.register(
+    Gauge("cache_compression_ratio", "Raw to stored size of compressed Redis cache values")
+)
+CACHE_CODEC_SECONDS = REGISTRY.register(
+    Counter("cache_codec_seconds_total", "Time spent compressing and decompressing cache values", ("operation",))
+)
+
+ES_LATENCY = REGISTRY.register(
+    Histogram("es_request_duration_seconds", "Elasticsearch call latency per attempt", ("operation", "index"))
+)
+ES_RETRIES = REGISTRY.register(Counter("es_retries_total", "Elasticsearch calls retried by backoff", ("operation",)))
+ES_GIVEUPS = REGISTRY.register(
+    Counter("es_giveups_total", "Elasticsearch calls that failed after all retries", ("operation",))
+)
+ES_HEDGES = REGISTRY.register(
+    Counter("es_hedged_requests_total", "Hedged Elasticsearch reads by outcome", ("index", "outcome"))
+)
+DEADLINE_EXCEEDED = REGISTRY.register(
+    Counter("deadline_exceeded_total", "Storage calls stopped by the request deadline", ("operation",))
+)
+ES_NODE_LATENCY = REGISTRY.register(
+    Histogram("es_node_request_duration_seconds", "Elasticsearch HTTP request latency per node", ("node",))
+)
+ES_POOL = REGISTRY.register(
+    Gauge("es_pool_connections", "Elasticsearch sockets per node by state (in_use, idle, max)", ("node", "state"))
+)
+ES_NODES = REGISTRY.register(Gauge("es_node_alive", "Elasticsearch nodes known to the client, 1 if alive", ("node",)))
+
+BREAKER_STATE = REGISTRY.register(
+    Gauge("circuit_breaker_state", "Storage circuit breaker state: 0 closed, 1 half-open, 2 open", ("index",))
+)
+BREAKER_TRANSITIONS = REGISTRY.register(
+    Counter("circuit_breaker_transitions_total", "Circuit breaker state changes", ("index", "state"))
+)
+BREAKER_REJECTIONS = REGISTRY.register(
+    Counter("circuit_breaker_rejections_total", "Storage calls failed fast by an open breaker", ("index",))
+)
+
+REDIS_POOL = REGISTRY.register(Gauge("redis_pool_connections", "Redis pool connections by state", ("state",)))
+REDIS_POOL_SATURATION = REGISTRY.register(
+    Gauge("redis_pool_saturation", "Share of the Redis pool maxsize checked out for exclusive use")
+)
+REDIS_POOL_WAIT = REGISTRY.register(
+    Histogram(
+        "redis_pool_checkout_wait_seconds",
+        "Time spent waiting to check out a Redis connection",
+        buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    )
+)
+REDIS_POOL_REJECTIONS = REGISTRY.register(
+    Counter("redis_pool_rejections_total", "Redis checkouts refused because the wait queue was full")
+)
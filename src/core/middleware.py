@@ -0,0 +1,273 @@
+import asyncio
+import hmac
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import asdict
+from http import HTTPStatus
+from typing import Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import metrics, request_trace
+from src.db import redis
+from src.services.base_cache import CACHE_ERRORS
+
+# A logger of its own, so the slow request log can be routed apart from the rest
+slow_logger = logging.getLogger("slow_requests")
+
+
+class MetricsMiddleware:
+    """Records per-route latency and status counts.
+
+    Plain ASGI rather than BaseHTTPMiddleware: no extra task or response
+    streaming per request. The route name is the endpoint function name,
+    which the router stores in the scope once it has matched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.in_flight = metrics.HTTP_IN_FLIGHT.labels()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            endpoint = scope.get("endpoint")
+            route = getattr(endpoint, "__name__", "unmatched")
+            method = scope["method"]
+            metrics.HTTP_LATENCY.labels(route, method).observe(time.perf_counter() - started)
+            metrics.HTTP_REQUESTS.labels(route, method, str(status_code)).inc()
+
+
+def _exempt(scope: Scope, prefixes: tuple[str, ...]) -> bool:
+    return scope["type"] != "http" or scope["path"].startswith(prefixes)
+
+
+class AdmissionMiddleware:
+    """Caps concurrent requests per worker and sheds the excess with a fast 503.
+
+    Up to ``max_in_flight`` requests run at once; up to ``queue_size`` more wait in FIFO order
+    for at most ``queue_timeout`` seconds. Anything beyond that is answered before it can reach
+    storage, so a spike degrades into rejected requests rather than into latency for everyone.
+    """
+
+    def __init__(
+        self, app: ASGIApp, max_in_flight: int, queue_size: int, queue_timeout: float, exempt: tuple[str, ...] = ()
+    ):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.exempt = exempt
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.queued = metrics.HTTP_QUEUED.labels()
+
+    async def _admit(self) -> Optional[str]:
+        """Takes a slot, waiting for one if needed; returns the reason to shed otherwise."""
+        if self.active < self.max_in_flight and not self.waiters:
+            self.active += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued.inc()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over after the timeout fired but before this task resumed
+                return None
+            self._discard(waiter)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the client went away
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+        finally:
+            self.queued.dec()
+        return None
+
+    def _discard(self, waiter: asyncio.Future):
+        # A release in between may have popped the cancelled waiter already
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+
+    def _release(self):
+        # The slot passes straight to the oldest waiter, so ``active`` stays the same. Waiters
+        # cancelled by their timeout stay queued until their task resumes and are skipped here.
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if _exempt(scope, self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        if reason := await self._admit():
+            metrics.HTTP_SHED.labels(reason).inc()
+            response = ORJSONResponse(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                content={"detail": "server overloaded"},
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._release()
+
+
+class RateLimitMiddleware:
+    """Answers 429 to clients that ran out of tokens in their Redis bucket.
+
+    The client is the X-Real-IP header set by nginx, or the peer address without nginx.
+    Redis failures let the request through: the limit protects the service, the cache
+    being down must not take it offline.
+    """
+
+    def __init__(self, app: ASGIApp, exempt: tuple[str, ...] = ()):
+        self.app = app
+        self.exempt = exempt
+
+    @staticmethod
+    def client(scope: Scope) -> str:
+        for name, value in scope["headers"]:
+            if name == b"x-real-ip":
+                return value.decode("latin-1")
+        return scope["client"][0] if scope.get("client") else "unknown"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if _exempt(scope, self.exempt) or redis.redis is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            retry_after = await redis.get_rate_limiter().take(self.client(scope))
+        except CACHE_ERRORS:
+            metrics.RATE_LIMIT_ERRORS.labels().inc()
+            retry_after = 0
+        if retry_after:
+            metrics.RATE_LIMITED.labels().inc()
+            response = ORJSONResponse(
+                status_code=HTTPStatus.TOO_MANY_REQUESTS,
+                content={"detail": "too many requests"},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def _without_profile(fields: list[tuple]) -> dict:
+    # ES profile output runs to hundreds of lines per search, it is only returned to the caller
+    return {name: value for name, value in fields if name != "profile"}
+
+
+class TraceMiddleware:
+    """Logs requests slower than ``threshold`` seconds with what they asked of storage.
+
+    The record holds every ES search the request sent (the exact body, ES ``took`` against
+    the wall time around it, hit counts), the cache outcome and the response size. With
+    ``?profile=true`` and an X-Debug-Token header equal to ``profile_token`` the searches run
+    with ES profiling and the response is replaced by the original one plus the trace.
+    """
+
+    def __init__(self, app: ASGIApp, threshold: float, profile_token: str = ""):
+        self.app = app
+        self.threshold = threshold
+        self.profile_token = profile_token.encode()
+
+    def _profile_requested(self, scope: Scope) -> bool:
+        return b"profile=true" in scope["query_string"].split(b"&")
+
+    def _authorized(self, scope: Scope) -> bool:
+        token = next((value for name, value in scope["headers"] if name == b"x-debug-token"), b"")
+        return bool(self.profile_token) and hmac.compare_digest(token, self.profile_token)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = self._profile_requested(scope)
+        if profile and not self._authorized(scope):
+            response = ORJSONResponse(status_code=HTTPStatus.FORBIDDEN, content={"detail": "profiling is not allowed"})
+            await response(scope, receive, send)
+            return
+
+        trace = request_trace.start(profile)
+        status_code = 500
+        size = 0
+        body = bytearray()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if profile:
+                    body.extend(message.get("body", b""))
+            if not profile:
+                await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            wall = time.perf_counter() - started
+            if self.threshold and wall >= self.threshold:
+                record = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope["query_string"].decode("latin-1"),
+                    "status": status_code,
+                    "wall_ms": round(wall * 1000, 1),
+                    "response_bytes": size,
+                    "cache": trace.cache,
+                    "searches": [asdict(search, dict_factory=_without_profile) for search in trace.searches],
+                }
+                slow_logger.warning("Slow request %s", orjson.dumps(record).decode())
+
+        if profile:
+            try:
+                original = orjson.loads(body)
+            except orjson.JSONDecodeError:
+                original = body.decode("utf-8", "replace")
+            content = {
+                "status": status_code,
+                "wall_ms": round(wall * 1000, 1),
+                "cache": trace.cache,
+                "searches": [asdict(search) for search in trace.searches],
+                "response": original,
+            }
+            await ORJSONResponse(content, headers={"Cache-Control": "no-store"})(scope, receive, send)
@@ -0,0 +1,48 @@
+"""What a request did on its way to the response, for the slow request log and profiling.
+
+The middleware starts a trace per request; storage records every search it sends and the
+cached() decorator records how the cache answered. Like the deadline, the trace lives in a
+context variable, so tasks started by the request (hedged reads, gathers) record into it too.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+@dataclass
+class Search:
+    index: Optional[str]
+    body: dict
+    took_ms: int
+    wall_ms: float
+    hits: Optional[int]
+    returned: int
+    profile: Optional[dict] = None
+
+
+@dataclass
+class RequestTrace:
+    profile: bool = False
+    searches: list[Search] = field(default_factory=list)
+    cache: list[str] = field(default_factory=list)
+
+
+def start(profile: bool = False) -> RequestTrace:
+    trace = RequestTrace(profile=profile)
+    _trace.set(trace)
+    return trace
+
+
+def current() -> Optional[RequestTrace]:
+    return _trace.get()
+
+
+def profiling() -> bool:
+    return (trace := _trace.get()) is not None and trace.profile
+
+
+def record_cache(result: str):
+    if (trace := _trace.get()) is not None:
+        trace.cache.append(result)
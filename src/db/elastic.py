@@ -1,12 +1,109 @@
+import asyncio
+import time
 from functools import lru_cache
+from typing import Optional
 
-from elasticsearch import AsyncElasticsearch
+import aiohttp
+from elasticsearch import AIOHttpConnection, AsyncElasticsearch
+from elasticsearch._async.http_aiohttp import ESClientResponse
 
+from src.core import config, metrics
 from src.services.base_storage import ElasticsearchStorage
 
 es: AsyncElasticsearch = None
 
 
+class InstrumentedConnection(AIOHttpConnection):
+    """Connection to one ES node that times its requests and reports its socket pool.
+
+    Every node gets its own aiohttp connector holding at most ``maxsize`` (ES_MAXSIZE) sockets;
+    requests beyond that wait inside aiohttp for a socket to free up, and that wait is part of
+    the node latency.
+    """
+
+    def __init__(self, *args, keepalive_timeout: float = 15, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keepalive_timeout = keepalive_timeout
+        self._latency = metrics.ES_NODE_LATENCY.labels(self.host)
+
+    async def _create_aiohttp_session(self):
+        # Upstream session, but with a keepalive the upstream connector cannot be given
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            skip_auto_headers=("accept", "accept-encoding"),
+            auto_decompress=True,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=ESClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit,
+                use_dns_cache=True,
+                ssl=self._ssl_context,
+                keepalive_timeout=self.keepalive_timeout,
+            ),
+        )
+
+    async def perform_request(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().perform_request(*args, **kwargs)
+        finally:
+            self._latency.observe(time.perf_counter() - started)
+
+    def pool_stats(self) -> dict[str, int]:
+        connector = self.session.connector if self.session is not None else None
+        if connector is None or connector.closed:
+            return {"in_use": 0, "idle": 0, "max": self._limit}
+        # aiohttp keeps no public counters of its pool
+        return {
+            "in_use": len(connector._acquired),
+            "idle": sum(len(conns) for conns in connector._conns.values()),
+            "max": connector.limit,
+        }
+
+
+def create_client(hosts: Optional[list[str]] = None) -> AsyncElasticsearch:
+    hosts = hosts or [host.strip() for host in config.ELASTIC_HOSTS.split(",") if host.strip()]
+    return AsyncElasticsearch(
+        hosts=hosts,
+        connection_class=InstrumentedConnection,
+        maxsize=config.ES_MAXSIZE,
+        http_compress=config.ES_HTTP_COMPRESS,
+        keepalive_timeout=config.ES_KEEPALIVE,
+        sniff_on_start=config.ES_SNIFF_ON_START,
+        sniff_on_connection_fail=config.ES_SNIFF_ON_CONNECTION_FAIL,
+        sniffer_timeout=config.ES_SNIFF_INTERVAL or None,
+        sniff_timeout=config.ES_SNIFF_TIMEOUT,
+        dead_timeout=config.ES_DEAD_TIMEOUT,
+    )
+
+
 @lru_cache()
 def get_elastic() -> ElasticsearchStorage:
     return ElasticsearchStorage(es)
+
+
+def _connections() -> list[tuple[InstrumentedConnection, bool]]:
+    """Every node the client knows of and whether it is currently alive (not marked dead)."""
+    if not isinstance(es, AsyncElasticsearch):
+        return []
+    pool = es.transport.connection_pool
+    alive = set(pool.connections)
+    return [(connection, connection in alive) for connection, _ in pool.connection_opts]
+
+
+def collect_pool_metrics():
+    for connection, _ in _connections():
+        if isinstance(connection, InstrumentedConnection):
+            for state, value in connection.pool_stats().items():
+                yield (connection.host, state), value
+
+
+def collect_node_metrics():
+    for connection, alive in _connections():
+        yield (connection.host,), int(alive)
+
+
+metrics.ES_POOL.set_function(collect_pool_metrics)
+metrics.ES_NODES.set_function(collect_node_metrics)
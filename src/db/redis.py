@@ -1,12 +1,156 @@
+import time
 from functools import lru_cache
+from typing import Optional
 
-from aioredis import Redis
+import aioredis
+from aioredis import ConnectionsPool, Redis, RedisError
 
-from src.services.base_cache import RedisCache
+from src.core import config, metrics
+from src.services.base_cache import BaseCache, InMemoryCache, RedisCache, TwoTierCache
+from src.services.cache_codecs import get_codec
+from src.services.rate_limit import TokenBucketLimiter
 
 redis: Redis = None
 
 
+class PoolWaitQueueFull(RedisError):
+    """Raised instead of queueing behind REDIS_POOL_MAX_WAITERS other checkouts."""
+
+
+class InstrumentedPool(ConnectionsPool):
+    """aioredis pool that times connection checkouts and bounds how many may wait.
+
+    Plain commands share the free connections and never check one out; pipelines and
+    transactions hold a connection for themselves and queue when all of them are taken.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_waiters = config.REDIS_POOL_MAX_WAITERS
+        self.waiting = 0
+        self._wait = metrics.REDIS_POOL_WAIT.labels()
+
+    @property
+    def used(self) -> int:
+        return len(self._used)
+
+    async def acquire(self, command=None, args=()):
+        must_wait = not self.freesize and self.size >= self.maxsize
+        if must_wait and self.max_waiters and self.waiting >= self.max_waiters:
+            metrics.REDIS_POOL_REJECTIONS.labels().inc()
+            raise PoolWaitQueueFull(f"{self.waiting} checkouts already waiting for a connection")
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            return await super().acquire(command, args)
+        finally:
+            self.waiting -= 1
+            self._wait.observe(time.perf_counter() - started)
+
+
+async def create_pool(
+    address: Optional[tuple[str, int]] = None,
+    minsize: int = config.REDIS_POOL_MINSIZE,
+    maxsize: int = config.REDIS_POOL_MAXSIZE,
+) -> Redis:
+    return await aioredis.create_redis_pool(
+        address or (config.REDIS_HOST, config.REDIS_PORT),
+        minsize=minsize,
+        maxsize=maxsize,
+        timeout=config.REDIS_CONNECT_TIMEOUT or None,
+        pool_cls=InstrumentedPool,
+    )
+
+
 @lru_cache()
 def get_redis() -> RedisCache:
-    return RedisCache(redis)
+    return RedisCache(
+        redis,
+        codec=get_codec(config.CACHE_COMPRESSION, config.CACHE_COMPRESSION_LEVEL),
+        compress_min_bytes=config.CACHE_COMPRESSION_MIN_BYTES,
+        read_timeout=config.REDIS_READ_TIMEOUT,
+    )
+
+
+@lru_cache()
+def get_rate_limiter() -> TokenBucketLimiter:
+    return TokenBucketLimiter(redis, config.RATE_LIMIT_RATE, config.RATE_LIMIT_BURST, timeout=config.REDIS_READ_TIMEOUT)
+
+
+@lru_cache()
+def get_cache() -> BaseCache:
+    local = InMemoryCache(
+        max_entries=config.LOCAL_CACHE_MAX_ENTRIES,
+        max_bytes=config.LOCAL_CACHE_MAX_BYTES,
+        ttl=config.LOCAL_CACHE_TTL,
+    )
+    return TwoTierCache(local, get_redis())
+
+
+def collect_pool_metrics():
+    if redis is None:
+        return
+    pool = redis.connection
+    yield ("size",), pool.size
+    yield ("free",), pool.freesize
+    yield ("max",), pool.maxsize
+    if isinstance(pool, InstrumentedPool):
+        yield ("used",), pool.used
+        yield ("waiting",), pool.waiting
+
+
+def collect_pool_saturation():
+    if redis is None or not isinstance(redis.connection, InstrumentedPool):
+        return
+    pool = redis.connection
+    yield (), pool.used / pool.maxsize
+
+
+def collect_cache_metrics():
+    if redis is None:
+        return
+    cache = get_cache()
+    for tier, stats in (("l1", cache.local.stats), ("l2", cache.remote.stats)):
+        yield (tier, "hit"), stats.hits
+        yield (tier, "miss"), stats.misses
+        yield (tier, "eviction"), stats.evictions
+
+
+def collect_compression_values():
+    if redis is None:
+        return
+    stats = get_redis().compression
+    yield ("compressed",), stats.compressed
+    yield ("skipped",), stats.skipped
+    yield ("decompressed",), stats.decoded
+
+
+def collect_compression_bytes():
+    if redis is None:
+        return
+    stats = get_redis().compression
+    yield ("raw",), stats.raw_bytes
+    yield ("stored",), stats.stored_bytes
+
+
+def collect_compression_ratio():
+    if redis is None:
+        return
+    yield (), get_redis().compression.ratio
+
+
+def collect_codec_seconds():
+    if redis is None:
+        return
+    stats = get_redis().compression
+    yield ("encode",), stats.encode_seconds
+    yield ("decode",), stats.decode_seconds
+
+
+metrics.REDIS_POOL.set_function(collect_pool_metrics)
+metrics.REDIS_POOL_SATURATION.set_function(collect_pool_saturation)
+metrics.CACHE_TIER.set_function(collect_cache_metrics)
+metrics.CACHE_COMPRESSION_VALUES.set_function(collect_compression_values)
+metrics.CACHE_COMPRESSION_BYTES.set_function(collect_compression_bytes)
+metrics.CACHE_COMPRESSION_RATIO.set_function(collect_compression_ratio)
+metrics.CACHE_CODEC_SECONDS.set_function(collect_codec_seconds)
@@ -0,0 +1,38 @@
+"""Cache invalidation after the ETL reloads or edits an index.
+
+Bumping the index generation retires every cached list of it at once (O(1), no key scan);
+the given ids additionally drop their cached details. Workers notice the new generation
+within CACHE_GENERATION_TTL seconds; details still held in a worker's in-process tier
+expire within LOCAL_CACHE_TTL.
+
+    python -m src.invalidate movies [id ...]
+"""
+import argparse
+import asyncio
+import logging
+
+from src.db import redis
+from src.utils import invalidate_cache
+
+logger = logging.getLogger(__name__)
+
+NAMESPACES = ("movies", "genres", "people")
+
+
+async def main(namespace: str, entity_ids: list[str]):
+    redis.redis = await redis.create_pool()
+    try:
+        await invalidate_cache(namespace, entity_ids)
+    finally:
+        redis.redis.close()
+        await redis.redis.wait_closed()
+    logger.info("Invalidated %s lists and %d details", namespace, len(entity_ids))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("namespace", choices=NAMESPACES)
+    parser.add_argument("ids", nargs="*", help="ids whose cached details are dropped too")
+    args = parser.parse_args()
+    asyncio.run(main(args.namespace, args.ids))
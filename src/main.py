@@ -1,16 +1,26 @@
+import asyncio
 import logging
+import math
+from http import HTTPStatus
 from logging import config as logging_config
 
-import aioredis
 import uvicorn as uvicorn
-from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import ORJSONResponse
 
+from src.api import metrics
 from src.core import config
+from src.core.deadline import DeadlineExceeded
 from src.core.logger import LOGGING
+from src.core.middleware import AdmissionMiddleware, MetricsMiddleware, RateLimitMiddleware, TraceMiddleware
 from src.db import elastic, redis
 from src.routes import api_router
+from src.services.circuit_breaker import CircuitOpenError
+from src.services.genre_catalog import genre_catalog
+from src.utils import run_in_background
+from src.warmup import claim_warm_up, warm_up
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -25,17 +35,62 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup():
     logging_config.dictConfig(LOGGING)
-    redis.redis = await aioredis.create_redis_pool((config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
-    elastic.es = AsyncElasticsearch(hosts=[f"{config.ELASTIC_HOST}:{config.ELASTIC_PORT}"])
+    redis.redis = await redis.create_pool()
+    elastic.es = elastic.create_client()
+    if config.GENRE_CATALOG_ENABLED:
+        genre_catalog.start(elastic.get_elastic())
+
+
+@app.on_event("startup")
+async def warm_cache():
+    if not config.WARMUP_ENABLED:
+        return
+    if not await claim_warm_up():
+        logger.info("Cache warm-up is run by another worker")
+        return
+    # Readiness waits for the warm-up at most WARMUP_BUDGET seconds, the rest runs in the background
+    task = run_in_background(warm_up(app))
+    if not (await asyncio.wait({task}, timeout=config.WARMUP_BUDGET))[0]:
+        logger.info("Cache warm-up continues in the background")
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await genre_catalog.stop()
     await redis.redis.close()
     await elastic.es.close()
 
 
+@app.exception_handler(CircuitOpenError)
+async def storage_unavailable(request: Request, exc: CircuitOpenError):
+    return ORJSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={"detail": "storage temporarily unavailable"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return ORJSONResponse(status_code=HTTPStatus.GATEWAY_TIMEOUT, content={"detail": "storage did not answer in time"})
+
+
+exempt = tuple(path.strip() for path in config.ADMISSION_EXEMPT_PATHS.split(",") if path.strip())
+# Added last runs first: metrics see every response, throttled clients never take an admission slot
+app.add_middleware(
+    AdmissionMiddleware,
+    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+    queue_size=config.ADMISSION_QUEUE_SIZE,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+    exempt=exempt,
+)
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, exempt=exempt)
+app.add_middleware(TraceMiddleware, threshold=config.SLOW_REQUEST_THRESHOLD, profile_token=config.PROFILE_TOKEN)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router, prefix=config.API_V1_PREFIX)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     uvicorn.run(
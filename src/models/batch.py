@@ -0,0 +1,24 @@
+from typing import Generic, Optional, TypeVar
+
+import orjson
+from pydantic import BaseModel, conlist
+from pydantic.generics import GenericModel
+
+from src.core.config import BATCH_MAX_IDS
+from src.utils import orjson_dumps
+
+EntityT = TypeVar("EntityT")
+
+
+class BatchRequest(BaseModel):
+    ids: conlist(str, min_items=1, max_items=BATCH_MAX_IDS)
+
+    class Config:
+        json_loads = orjson.loads
+        json_dumps = orjson_dumps
+
+
+class BatchItem(GenericModel, Generic[EntityT]):
+    id: str
+    found: bool
+    data: Optional[EntityT] = None
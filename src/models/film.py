@@ -32,3 +32,17 @@ class Film(BaseModel):
     class Config:
         json_loads = orjson.loads
         json_dumps = orjson_dumps
+
+
+class FilmSummary(BaseModel):
+    """Compact film card for lists embedded in other entities."""
+
+    id: int
+    title: str
+    rating: float
+    type: MovieType
+    creation_date: datetime.datetime
+
+    class Config:
+        json_loads = orjson.loads
+        json_dumps = orjson_dumps
@@ -15,3 +15,12 @@ class Genre(BaseModel):
     class Config:
         json_loads = orjson.loads
         json_dumps = orjson_dumps
+
+
+class GenreSummary(BaseModel):
+    id: int
+    genre: str
+
+    class Config:
+        json_loads = orjson.loads
+        json_dumps = orjson_dumps
@@ -0,0 +1,22 @@
+from typing import Generic, TypeVar, Union
+
+from pydantic import BaseModel
+from pydantic.generics import GenericModel
+
+EntityT = TypeVar("EntityT")
+
+
+class TotalHits(BaseModel):
+    value: int
+    relation: str
+
+
+class FacetBucket(BaseModel):
+    key: Union[int, float, str]
+    count: int
+
+
+class FacetedPage(GenericModel, Generic[EntityT]):
+    total: TotalHits
+    items: list[EntityT]
+    facets: dict[str, list[FacetBucket]]
@@ -18,3 +18,13 @@ class Person(BaseModel):
     class Config:
         json_loads = orjson.loads
         json_dumps = orjson_dumps
+
+
+class PersonSummary(BaseModel):
+    id: UUID
+    first_name: str
+    last_name: str
+
+    class Config:
+        json_loads = orjson.loads
+        json_dumps = orjson_dumps
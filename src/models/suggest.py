@@ -0,0 +1,22 @@
+from enum import Enum
+
+import orjson
+from pydantic import BaseModel
+
+from src.utils import orjson_dumps
+
+
+class SuggestionType(str, Enum):
+    FILM = "film"
+    GENRE = "genre"
+    PERSON = "person"
+
+
+class Suggestion(BaseModel):
+    id: str
+    type: SuggestionType
+    title: str
+
+    class Config:
+        json_loads = orjson.loads
+        json_dumps = orjson_dumps
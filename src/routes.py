@@ -1,10 +1,11 @@
 from fastapi import APIRouter
 
-from src.api.v1 import film, genre, person, smoke
+from src.api.v1 import film, genre, person, smoke, suggest
 
 api_router = APIRouter()
 
 api_router.include_router(film.router, tags=["film"])
 api_router.include_router(genre.router, tags=["genre"])
 api_router.include_router(person.router, tags=["person"])
+api_router.include_router(suggest.router, tags=["suggest"])
 api_router.include_router(smoke.router, tags=["smoke"])
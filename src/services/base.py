@@ -1,7 +1,15 @@
 from abc import ABC
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from src.services.base_storage import BaseStorage
+from src.utils import encode_cursor
+
+
+class Page(list):
+    next_cursor: Optional[str] = None
+    # Filled only when the query asked for them (track_total_hits, aggs)
+    total: Optional[dict] = None
+    facets: Optional[dict[str, list[dict]]] = None
 
 
 class BaseService(ABC):
@@ -12,5 +20,31 @@ class BaseService(ABC):
     async def get(self, entity_id: str):
         return await self.storage.get_scalar(entity_id, self.index)
 
+    async def get_many(self, entity_ids: list[str]) -> list[dict]:
+        return await self.storage.get_many(entity_ids, self.index)
+
+    async def iter_all(self, query: dict) -> AsyncIterator[list[dict]]:
+        async for hits in self.storage.iter_all(query, self.index):
+            yield hits
+
     async def list(self, query: Optional[dict] = None):
         return await self.storage.get_all(query, self.index)
+
+    @staticmethod
+    def page(query: dict, docs: dict, items: list) -> Page:
+        page = Page(items)
+        hits = docs["hits"]["hits"]
+        if hits and len(hits) == query["size"]:
+            page.next_cursor = encode_cursor(query["sort"], hits[-1]["sort"])
+        if query.get("track_total_hits") or "aggs" in query:
+            page.total = docs["hits"]["total"]
+        if "aggs" in query:
+            page.facets = {
+                name: [
+                    {"key": bucket.get("key_as_string", bucket["key"]), "count": bucket["doc_count"]}
+                    # A facet over nested documents holds its buckets in a sub-aggregation of the same name
+                    for bucket in aggregation.get(name, aggregation)["buckets"]
+                ]
+                for name, aggregation in docs.get("aggregations", {}).items()
+            }
+        return page
@@ -1,33 +1,439 @@
+import asyncio
+import hashlib
+import logging
+import struct
+import time
+import uuid
+import zlib
 from abc import ABC, abstractmethod
-from typing import Optional, Union
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Optional, TypeVar, Union
 
-from aioredis import Redis
+import orjson
+from aioredis import Redis, RedisError
 
-from src.core.config import CACHE_TTL
+from src.core.config import CACHE_GENERATION_TTL, CACHE_TTL
+from src.services.cache_codecs import DECODERS, Codec, CompressionStats, Lz4Codec, ZlibCodec
+from src.services.cache_keys import generation_key
+
+# Envelope: format byte, meta length, orjson meta, payload.
+# The format byte tells whether the payload is plain or which codec compressed it.
+# Legacy values written as bare JSON start with "{", "[" or '"' and are read as never stale.
+ENVELOPE_HEADER = struct.Struct(">BH")
+FORMAT_PLAIN = 0x00
+KNOWN_FORMATS = frozenset({FORMAT_PLAIN, ZlibCodec.format_id, Lz4Codec.format_id})
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Cache failures after which the request is served straight from storage
+CACHE_ERRORS = (RedisError, OSError, asyncio.TimeoutError)
+
+# How many bytes to read from Redis to get an entry's meta without its body
+META_PREFETCH_BYTES = 512
+
+
+def content_etag(data: bytes) -> str:
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+@dataclass
+class CacheEntry:
+    data: bytes
+    soft_expires_at: float = 0
+    headers: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_stale(self) -> bool:
+        return 0 < self.soft_expires_at <= time.time()
+
+    @classmethod
+    def create(
+        cls, data: Union[str, bytes], soft_ttl: int = 0, headers: Optional[dict[str, str]] = None
+    ) -> "CacheEntry":
+        if isinstance(data, str):
+            data = data.encode()
+        # The ETag travels in the envelope meta, so conditional requests never need the body
+        headers = {"ETag": content_etag(data), **(headers or {})}
+        return cls(data=data, soft_expires_at=time.time() + soft_ttl if soft_ttl else 0, headers=headers)
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("ETag")
+
+    def pack(self, codec: Optional[Codec] = None) -> bytes:
+        meta = orjson.dumps({"soft": self.soft_expires_at, "headers": self.headers})
+        if codec is None:
+            return ENVELOPE_HEADER.pack(FORMAT_PLAIN, len(meta)) + meta + self.data
+        return ENVELOPE_HEADER.pack(codec.format_id, len(meta)) + meta + codec.compress(self.data)
+
+    @staticmethod
+    def meta_end(raw: bytes) -> Optional[int]:
+        """Offset where the payload starts, None for legacy values and too short prefixes."""
+        if len(raw) < ENVELOPE_HEADER.size or raw[0] not in KNOWN_FORMATS:
+            return None
+        _, meta_len = ENVELOPE_HEADER.unpack_from(raw)
+        return ENVELOPE_HEADER.size + meta_len
+
+    @classmethod
+    def unpack_meta(cls, raw: bytes) -> Optional["CacheEntry"]:
+        """Reads only the envelope meta from a value prefix: the returned entry has an empty payload."""
+        offset = cls.meta_end(raw)
+        if offset is None or len(raw) < offset:
+            return None
+        meta = orjson.loads(raw[ENVELOPE_HEADER.size : offset])
+        return cls(data=b"", soft_expires_at=meta["soft"], headers=meta.get("headers", {}))
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "CacheEntry":
+        value_format = raw[0]
+        if value_format not in KNOWN_FORMATS:
+            return cls(data=raw)
+        offset = cls.meta_end(raw)
+        meta = orjson.loads(raw[ENVELOPE_HEADER.size : offset])
+        data = raw[offset:]
+        if value_format != FORMAT_PLAIN:
+            if value_format not in DECODERS:
+                raise ValueError(f"cache value compressed with unavailable codec {value_format:#x}")
+            data = DECODERS[value_format].decompress(data)
+        return cls(data=data, soft_expires_at=meta["soft"], headers=meta.get("headers", {}))
 
 
 class BaseCache(ABC):
     @abstractmethod
-    async def cache(self, key: str, data: Union[dict, list]):
+    async def set_entry(self, key: str, entry: CacheEntry, ttl: int):
+        pass
+
+    @abstractmethod
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        pass
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        pass
+
+    @abstractmethod
+    async def get_generation(self, namespace: str) -> int:
         pass
 
     @abstractmethod
-    async def get_from_cache(self, key: str):
+    async def bump_generation(self, namespace: str) -> int:
         pass
 
+    async def cache(
+        self,
+        key: str,
+        data: Union[str, bytes],
+        ttl: Optional[int] = None,
+        soft_ttl: int = 0,
+        headers: Optional[dict[str, str]] = None,
+    ) -> CacheEntry:
+        entry = CacheEntry.create(data, soft_ttl, headers)
+        await self.set_entry(key, entry, ttl or CACHE_TTL)
+        return entry
+
+    async def get_meta(self, key: str) -> Optional[CacheEntry]:
+        """Entry headers and soft expiry, without the payload where the backend can avoid reading it."""
+        return await self.get_entry(key)
+
+    async def get_from_cache(self, key: str) -> Optional[bytes]:
+        if (entry := await self.get_entry(key)) is not None:
+            return entry.data
+        return None
+
+    async def get_entries(self, keys: list[str]) -> list[Optional[CacheEntry]]:
+        return [await self.get_entry(key) for key in keys]
+
+    async def set_entries(self, entries: dict[str, CacheEntry], ttl: int):
+        for key, entry in entries.items():
+            await self.set_entry(key, entry, ttl)
+
+    async def acquire_lock(self, key: str, lease_ms: int) -> bool:
+        return True
+
+    async def release_lock(self, key: str):
+        # Nothing to release: backends without cross-worker locks grant every acquire_lock
+        return None
+
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
 
 class RedisCache(BaseCache):
-    def __init__(self, redis: Redis):
+    def __init__(
+        self, redis: Redis, codec: Optional[Codec] = None, compress_min_bytes: int = 0, read_timeout: float = 0
+    ):
         self.redis = redis
+        self.codec = codec
+        self.compress_min_bytes = compress_min_bytes
+        self.read_timeout = read_timeout
+        self.stats = CacheStats()
+        self.compression = CompressionStats()
+        self._lock_tokens: dict[str, str] = {}
 
-    async def cache(self, key: str, data: Union[str, bytes]):
-        await self.redis.set(key, data, expire=CACHE_TTL)
+    def _io(self, awaitable: Awaitable[T]) -> Awaitable[T]:
+        # aioredis 1.x has no read timeout; asyncio.TimeoutError is one of CACHE_ERRORS
+        if self.read_timeout:
+            return asyncio.wait_for(awaitable, self.read_timeout)
+        return awaitable
 
-    async def get_from_cache(self, key: str) -> Optional[bytes]:
-        data = await self.redis.get(key)
-        if not data:
+    def pack(self, entry: CacheEntry) -> bytes:
+        if self.codec is None or len(entry.data) < self.compress_min_bytes:
+            self.compression.skipped += 1
+            return entry.pack()
+
+        started = time.perf_counter()
+        raw = entry.pack(self.codec)
+        self.compression.encode_seconds += time.perf_counter() - started
+        self.compression.compressed += 1
+        self.compression.raw_bytes += len(entry.data)
+        self.compression.stored_bytes += len(raw)
+        return raw
+
+    def unpack(self, raw: bytes) -> Optional[CacheEntry]:
+        if raw[0] == FORMAT_PLAIN or raw[0] not in KNOWN_FORMATS:
+            return CacheEntry.unpack(raw)
+
+        started = time.perf_counter()
+        try:
+            entry = CacheEntry.unpack(raw)
+        except (ValueError, zlib.error):
+            logger.warning("Unreadable cache value, treating as miss", exc_info=True)
+            return None
+        self.compression.decode_seconds += time.perf_counter() - started
+        self.compression.decoded += 1
+        return entry
+
+    async def set_entry(self, key: str, entry: CacheEntry, ttl: int):
+        await self._io(self.redis.set(key, self.pack(entry), expire=ttl))
+
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        data = await self._io(self.redis.get(key))
+        if not data or (entry := self.unpack(data)) is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return entry
+
+    async def get_meta(self, key: str) -> Optional[CacheEntry]:
+        head = await self._io(self.redis.getrange(key, 0, META_PREFETCH_BYTES - 1))
+        if not head or (offset := CacheEntry.meta_end(head)) is None:
             return None
-        return data
+        if len(head) < offset:
+            head = await self._io(self.redis.getrange(key, 0, offset - 1))
+        return CacheEntry.unpack_meta(head)
+
+    async def get_entries(self, keys: list[str]) -> list[Optional[CacheEntry]]:
+        if not keys:
+            return []
+        entries = []
+        for data in await self._io(self.redis.mget(*keys)):
+            if not data or (entry := self.unpack(data)) is None:
+                self.stats.misses += 1
+                entries.append(None)
+            else:
+                self.stats.hits += 1
+                entries.append(entry)
+        return entries
+
+    async def set_entries(self, entries: dict[str, CacheEntry], ttl: int):
+        if not entries:
+            return
+        pipe = self.redis.pipeline()
+        for key, entry in entries.items():
+            pipe.set(key, self.pack(entry), expire=ttl)
+        try:
+            await self._io(pipe.execute())
+        except BaseException:
+            # aioredis leaves the buffered commands pending when execute never got a connection
+            for future in pipe._results:
+                future.cancel()
+            raise
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._io(self.redis.delete(*keys))
+
+    async def get_generation(self, namespace: str) -> int:
+        return int(await self._io(self.redis.get(generation_key(namespace))) or 0)
+
+    async def bump_generation(self, namespace: str) -> int:
+        return await self._io(self.redis.incr(generation_key(namespace)))
+
+    async def acquire_lock(self, key: str, lease_ms: int) -> bool:
+        token = uuid.uuid4().hex
+        acquired = await self._io(self.redis.set(f"lock:{key}", token, pexpire=lease_ms, exist=Redis.SET_IF_NOT_EXIST))
+        if acquired:
+            self._lock_tokens[key] = token
+        return bool(acquired)
+
+    async def release_lock(self, key: str):
+        if (token := self._lock_tokens.pop(key, None)) is not None:
+            await self._io(self.redis.eval(RELEASE_LOCK_SCRIPT, keys=[f"lock:{key}"], args=[token]))
 
     async def clear(self):
         await self.redis.flushdb()
+
+
+class InMemoryCache(BaseCache):
+    """Per-worker LRU cache bounded by entry count and total payload size."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, tuple[float, CacheEntry]] = OrderedDict()
+        self._size = 0
+        self._generations: dict[str, int] = {}
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def set_entry(self, key: str, entry: CacheEntry, ttl: int):
+        ttl = min(self.ttl, ttl)
+        if ttl <= 0 or len(entry.data) > self.max_bytes:
+            return
+
+        self._pop(key)
+        self._entries[key] = (time.monotonic() + ttl, entry)
+        self._size += len(entry.data)
+
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted.data)
+            self.stats.evictions += 1
+
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        item = self._entries.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return None
+
+        expires_at, entry = item
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._pop(key)
+
+    async def get_generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    async def bump_generation(self, namespace: str) -> int:
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        return self._generations[namespace]
+
+    async def clear(self):
+        self._entries.clear()
+        self._size = 0
+        self._generations.clear()
+
+    def _pop(self, key: str):
+        if (item := self._entries.pop(key, None)) is not None:
+            self._size -= len(item[1].data)
+
+
+class TwoTierCache(BaseCache):
+    """In-process L1 in front of a shared L2 (Redis)."""
+
+    def __init__(self, local: InMemoryCache, remote: RedisCache):
+        self.local = local
+        self.remote = remote
+        self._generations: dict[str, tuple[float, int]] = {}
+
+    async def set_entry(self, key: str, entry: CacheEntry, ttl: int):
+        await self.remote.set_entry(key, entry, ttl)
+        await self.local.set_entry(key, entry, ttl)
+
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        if (entry := await self.local.get_entry(key)) is not None:
+            return entry
+
+        entry = await self.remote.get_entry(key)
+        if entry is not None:
+            await self.local.set_entry(key, entry, self.local.ttl)
+        return entry
+
+    async def get_meta(self, key: str) -> Optional[CacheEntry]:
+        if (entry := await self.local.get_entry(key)) is not None:
+            return entry
+        return await self.remote.get_meta(key)
+
+    async def get_entries(self, keys: list[str]) -> list[Optional[CacheEntry]]:
+        entries = await self.local.get_entries(keys)
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            remote_entries = await self.remote.get_entries([keys[i] for i in missing])
+            for i, entry in zip(missing, remote_entries):
+                if entry is not None:
+                    entries[i] = entry
+                    await self.local.set_entry(keys[i], entry, self.local.ttl)
+        return entries
+
+    async def set_entries(self, entries: dict[str, CacheEntry], ttl: int):
+        await self.remote.set_entries(entries, ttl)
+        await self.local.set_entries(entries, ttl)
+
+    async def delete(self, *keys: str):
+        await self.remote.delete(*keys)
+        await self.local.delete(*keys)
+
+    async def get_generation(self, namespace: str) -> int:
+        # Remembered briefly so list lookups don't pay an extra Redis round trip each
+        expires_at, generation = self._generations.get(namespace, (0, 0))
+        if expires_at <= time.monotonic():
+            generation = await self.remote.get_generation(namespace)
+            self._generations[namespace] = (time.monotonic() + CACHE_GENERATION_TTL, generation)
+        return generation
+
+    async def bump_generation(self, namespace: str) -> int:
+        generation = await self.remote.bump_generation(namespace)
+        self._generations[namespace] = (time.monotonic() + CACHE_GENERATION_TTL, generation)
+        return generation
+
+    async def acquire_lock(self, key: str, lease_ms: int) -> bool:
+        return await self.remote.acquire_lock(key, lease_ms)
+
+    async def release_lock(self, key: str):
+        await self.remote.release_lock(key)
+
+    async def clear(self):
+        await self.local.clear()
+        await self.remote.clear()
+        self._generations.clear()
+
+    def stats(self) -> dict:
+        return {
+            "l1": {**self.local.stats.as_dict(), "entries": len(self.local), "bytes": self.local.size},
+            "l2": self.remote.stats.as_dict(),
+            "compression": self.remote.compression.as_dict(),
+        }
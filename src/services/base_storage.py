@@ -1,9 +1,110 @@
+import asyncio
+import inspect
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from functools import wraps
+from typing import AsyncIterator, Optional
 
 import backoff
 from elasticsearch import ElasticsearchException
-from elasticsearch.exceptions import NotFoundError
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
+from elasticsearch.exceptions import ConnectionTimeout, NotFoundError, TransportError
+
+from src.core import config, deadline, metrics, request_trace
+from src.services.circuit_breaker import get_breaker
+from src.services.hedging import hedged
+
+logger = logging.getLogger(__name__)
+
+
+def _on_backoff(details: dict):
+    metrics.ES_RETRIES.labels(details["target"].__name__).inc()
+
+
+def _on_giveup(details: dict):
+    metrics.ES_GIVEUPS.labels(details["target"].__name__).inc()
+
+
+def _jitter(value: float) -> float:
+    # backoff caps the wait by max_time counted from the start of the failed attempt, not its end
+    seconds = backoff.random_jitter(value)
+    if (left := deadline.remaining()) is not None:
+        seconds = min(seconds, max(0.0, left))
+    return seconds
+
+
+es_backoff = backoff.on_exception(
+    backoff.expo,
+    ElasticsearchException,
+    max_tries=3,
+    # Retries never outlive the request deadline: no new attempt starts once it is spent
+    max_time=deadline.remaining,
+    jitter=_jitter,
+    on_backoff=_on_backoff,
+    on_giveup=_on_giveup,
+)
+
+
+def is_storage_failure(exc: Exception) -> bool:
+    """Errors that say the cluster is unhealthy, as opposed to a bad request or a missing document."""
+    if isinstance(exc, ESConnectionError):
+        return True
+    if not isinstance(exc, TransportError):
+        return False
+    status = exc.status_code
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def circuit_breaker(func):
+    """Runs each attempt through the breaker of the index it targets.
+
+    Applied under es_backoff: an open breaker raises CircuitOpenError, which backoff does not
+    retry, so retries stop as soon as the breaker opens.
+    """
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        breaker = get_breaker(signature.bind(*args, **kwargs).arguments.get("index") or "_all")
+        breaker.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except Exception as exc:
+            breaker.record(not is_storage_failure(exc))
+            raise
+        breaker.record(True)
+        return result
+
+    return wrapper
+
+
+def within_deadline(func):
+    """Stops storage calls at the request deadline.
+
+    Applied between es_backoff and circuit_breaker: DeadlineExceeded is not an Elasticsearch
+    error, so backoff doesn't retry it, and an attempt that never started isn't recorded by the
+    breaker. A client timeout hit because the budget ran out is reported the same way.
+    """
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            deadline.check()
+            return await func(*args, **kwargs)
+        except deadline.DeadlineExceeded:
+            metrics.DEADLINE_EXCEEDED.labels(func.__name__).inc()
+            raise
+        except ConnectionTimeout as exc:
+            if (left := deadline.remaining()) is None or left > 0:
+                raise
+            metrics.DEADLINE_EXCEEDED.labels(func.__name__).inc()
+            raise deadline.DeadlineExceeded(deadline.budget()) from exc
+
+    return wrapper
 
 
 class BaseStorage(ABC):
@@ -18,32 +119,127 @@ class BaseStorage(ABC):
     async def get_scalar(self, entity_id: str, index: Optional[str] = None):
         pass
 
+    @abstractmethod
+    async def get_many(self, entity_ids: list[str], index: Optional[str] = None) -> list[dict]:
+        pass
+
+    async def iter_all(self, query: dict, index: Optional[str] = None) -> AsyncIterator[list[dict]]:
+        """Yields every matching hit page by page, walking the index with search_after."""
+        query = {**query, "from": 0}
+        while True:
+            hits = (await self.get_all(query, index))["hits"]["hits"]
+            if hits:
+                yield hits
+            if len(hits) < query["size"]:
+                return
+            query["search_after"] = hits[-1]["sort"]
+
 
 class ElasticsearchStorage(BaseStorage):
-    @backoff.on_exception(
-        backoff.expo,
-        ElasticsearchException,
-        max_tries=3,
-        jitter=backoff.random_jitter,
-    )
+    @es_backoff
+    @within_deadline
+    @circuit_breaker
     async def get_all(self, query: Optional[dict] = None, index: Optional[str] = None):
-        return await self.db.search(
-            index=index,
-            body=query.get("query"),
-            sort=query["sort"],
-            size=query["size"],
-            from_=query["from"],
-            _source=query["_source"],
-        )
-
-    @backoff.on_exception(
-        backoff.expo,
-        ElasticsearchException,
-        max_tries=3,
-        jitter=backoff.random_jitter,
-    )
+        body = dict(query.get("query") or {})
+        if search_after := query.get("search_after"):
+            body["search_after"] = search_after
+        # Aggregations ride on the same search request as the hits
+        for option in ("aggs", "track_total_hits"):
+            if option in query:
+                body[option] = query[option]
+        if trace := request_trace.current():
+            if trace.profile:
+                body["profile"] = True
+            started = time.perf_counter()
+        with metrics.ES_LATENCY.labels("search", index).time():
+            response = await self.db.search(
+                index=index,
+                body=body or None,
+                sort=query["sort"],
+                size=query["size"],
+                from_=query["from"],
+                _source=query["_source"],
+                request_timeout=deadline.remaining(),
+            )
+        if trace:
+            trace.searches.append(
+                request_trace.Search(
+                    index=index,
+                    # The request exactly as ES received it, parameters sent in the URL included
+                    body={**body, **{key: query[key] for key in ("sort", "size", "from", "_source")}},
+                    took_ms=response.get("took", 0),
+                    wall_ms=round((time.perf_counter() - started) * 1000, 1),
+                    hits=(response["hits"].get("total") or {}).get("value"),
+                    returned=len(response["hits"]["hits"]),
+                    profile=response.get("profile"),
+                )
+            )
+        return response
+
+    @es_backoff
+    @within_deadline
+    @circuit_breaker
     async def get_scalar(self, entity_id: str, index: Optional[str] = None):
+        if config.ES_HEDGE_ENABLED:
+            return await hedged(index, lambda preference: self._get(entity_id, index, preference))
+        return await self._get(entity_id, index)
+
+    async def _get(self, entity_id: str, index: Optional[str], preference: Optional[str] = None):
         try:
-            return await self.db.get(index, entity_id)
+            with metrics.ES_LATENCY.labels("get", index).time():
+                return await self.db.get(index, entity_id, preference=preference, request_timeout=deadline.remaining())
         except NotFoundError:
             return None
+
+    @es_backoff
+    @within_deadline
+    @circuit_breaker
+    async def get_many(self, entity_ids: list[str], index: Optional[str] = None) -> list[dict]:
+        if not entity_ids:
+            return []
+        with metrics.ES_LATENCY.labels("mget", index).time():
+            response = await self.db.mget(body={"ids": entity_ids}, index=index, request_timeout=deadline.remaining())
+        return response["docs"]
+
+    async def iter_all(self, query: dict, index: Optional[str] = None) -> AsyncIterator[list[dict]]:
+        # A point in time keeps the snapshot consistent while the walk takes minutes,
+        # search_after keeps every page as cheap as the first one
+        pit = await self._open_point_in_time(index)
+        body = dict(query.get("query") or {})
+        body["pit"] = {"id": pit, "keep_alive": config.EXPORT_PIT_KEEP_ALIVE}
+        try:
+            while True:
+                response = await self._search_point_in_time(body, query, index)
+                body["pit"]["id"] = response.get("pit_id", body["pit"]["id"])
+                hits = response["hits"]["hits"]
+                if hits:
+                    yield hits
+                if len(hits) < query["size"]:
+                    return
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            try:
+                await self.db.close_point_in_time(body={"id": body["pit"]["id"]})
+            except ElasticsearchException:
+                logger.warning("failed to close point in time for index %s", index, exc_info=True)
+
+    @es_backoff
+    @within_deadline
+    @circuit_breaker
+    async def _open_point_in_time(self, index: Optional[str]) -> str:
+        response = await self.db.open_point_in_time(index=index, keep_alive=config.EXPORT_PIT_KEEP_ALIVE)
+        return response["id"]
+
+    @es_backoff
+    @within_deadline
+    @circuit_breaker
+    async def _search_point_in_time(self, body: dict, query: dict, index: Optional[str]) -> dict:
+        # Searches against a point in time must not name the index
+        with metrics.ES_LATENCY.labels("search_pit", index).time():
+            return await self.db.search(
+                body=body,
+                sort=query["sort"],
+                size=query["size"],
+                _source=query["_source"],
+                request_timeout=deadline.remaining(),
+            )
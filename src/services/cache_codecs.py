@@ -0,0 +1,95 @@
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover - lz4 is an optional dependency
+    lz4 = None
+
+
+@dataclass
+class CompressionStats:
+    compressed: int = 0
+    skipped: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    encode_seconds: float = 0
+    decoded: int = 0
+    decode_seconds: float = 0
+
+    @property
+    def ratio(self) -> float:
+        return self.raw_bytes / self.stored_bytes if self.stored_bytes else 1.0
+
+    def as_dict(self) -> dict:
+        return {
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(self.ratio, 3),
+            "encode_seconds": self.encode_seconds,
+            "decoded": self.decoded,
+            "decode_seconds": self.decode_seconds,
+        }
+
+
+class Codec(ABC):
+    name: str
+    format_id: int
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        pass
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    format_id = 0x01
+
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class Lz4Codec(Codec):
+    name = "lz4"
+    format_id = 0x02
+
+    def __init__(self, level: int = 0):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4.frame.decompress(data)
+
+
+def available_codecs(level: Optional[int] = None) -> dict[str, Codec]:
+    codecs = {"zlib": ZlibCodec() if level is None else ZlibCodec(level)}
+    if lz4 is not None:
+        codecs["lz4"] = Lz4Codec() if level is None else Lz4Codec(level)
+    return codecs
+
+
+def get_codec(name: str, level: Optional[int] = None) -> Optional[Codec]:
+    if name == "none":
+        return None
+    codecs = available_codecs(level)
+    # lz4 falls back to zlib when the package isn't installed
+    return codecs.get(name) or codecs["zlib"]
+
+
+DECODERS = {codec.format_id: codec for codec in available_codecs().values()}
@@ -0,0 +1,45 @@
+import hashlib
+from enum import Enum
+from typing import Any, Optional
+
+import orjson
+
+from src.core.config import CACHE_KEY_PREFIX
+
+# Params that ES searches case-insensitively
+CASE_INSENSITIVE_PARAMS = frozenset({"search_query", "query"})
+
+
+def detail_key(namespace: str, entity_id: Any) -> str:
+    return f"{CACHE_KEY_PREFIX}:{namespace}:detail:{entity_id}"
+
+
+def generation_key(namespace: str) -> str:
+    return f"{CACHE_KEY_PREFIX}:{namespace}:gen"
+
+
+KEY_PARAM_TYPES = (str, int, float, bool, Enum)
+
+
+def normalize_param(name: str, value: Any) -> Any:
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        if name in CASE_INSENSITIVE_PARAMS:
+            value = value.casefold()
+    return value
+
+
+def list_key(namespace: str, generation: int, params: dict[str, Any], defaults: Optional[dict[str, Any]] = None) -> str:
+    # Params left at their default stay out of the key, so a new optional endpoint
+    # param doesn't change the keys of requests cached before it
+    defaults = defaults or {}
+    normalized = {}
+    for name, value in params.items():
+        value = normalize_param(name, value)
+        if name in defaults and value == normalize_param(name, defaults[name]):
+            continue
+        normalized[name] = value
+    digest = hashlib.blake2b(orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+    return f"{CACHE_KEY_PREFIX}:{namespace}:list:g{generation}:{digest}"
@@ -0,0 +1,136 @@
+"""Per-index circuit breakers for the storage layer.
+
+A breaker watches the outcome of storage calls over a sliding time window. Once enough
+calls were made and the failure rate crosses the threshold it opens: calls fail fast with
+CircuitOpenError instead of piling up (and being retried) against a struggling cluster.
+After a cool-down it lets a few probe calls through (half-open); a successful probe closes
+it, a failed one opens it again.
+"""
+import time
+from collections import deque
+from enum import Enum
+from typing import Optional
+
+from src.core import config, metrics
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+STATE_VALUES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(name, retry_after)
+        self.name = name
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return f"circuit for {self.name} is open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        min_calls: int = 20,
+        window: float = 10,
+        open_seconds: float = 5,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self._calls: deque[tuple[float, bool]] = deque()
+        self._failures = 0
+        self._probes = 0
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not reach the storage."""
+        if self.state == CircuitState.OPEN:
+            if self.retry_after > 0:
+                metrics.BREAKER_REJECTIONS.labels(self.name).inc()
+                raise CircuitOpenError(self.name, self.retry_after)
+            self._transition(CircuitState.HALF_OPEN)
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                metrics.BREAKER_REJECTIONS.labels(self.name).inc()
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probes += 1
+
+    def record(self, ok: bool):
+        if self.state == CircuitState.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            self._transition(CircuitState.CLOSED if ok else CircuitState.OPEN)
+            return
+        if self.state == CircuitState.OPEN:
+            # A call that started before the breaker opened
+            return
+
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        self._failures += not ok
+        while self._calls and self._calls[0][0] < now - self.window:
+            _, expired_ok = self._calls.popleft()
+            self._failures -= not expired_ok
+
+        if not ok and len(self._calls) >= self.min_calls and self._failures / len(self._calls) >= self.failure_rate:
+            self._transition(CircuitState.OPEN)
+
+    def abandon(self):
+        """Releases a probe slot of a call that ended without an outcome (cancelled)."""
+        if self.state == CircuitState.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _transition(self, state: CircuitState):
+        self.state = state
+        self._calls.clear()
+        self._failures = 0
+        if state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        if state != CircuitState.HALF_OPEN:
+            self._probes = 0
+        metrics.BREAKER_TRANSITIONS.labels(self.name, state.value).inc()
+
+
+breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if (breaker := breakers.get(name)) is None:
+        breaker = breakers[name] = CircuitBreaker(
+            name,
+            failure_rate=config.BREAKER_FAILURE_RATE,
+            min_calls=config.BREAKER_MIN_CALLS,
+            window=config.BREAKER_WINDOW,
+            open_seconds=config.BREAKER_OPEN_SECONDS,
+            half_open_probes=config.BREAKER_HALF_OPEN_PROBES,
+        )
+    return breaker
+
+
+def is_degraded(name: str) -> bool:
+    breaker: Optional[CircuitBreaker] = breakers.get(name)
+    return breaker is not None and breaker.state != CircuitState.CLOSED
+
+
+def collect_breaker_states():
+    return [((name,), STATE_VALUES[breaker.state]) for name, breaker in breakers.items()]
+
+
+metrics.BREAKER_STATE.set_function(collect_breaker_states)
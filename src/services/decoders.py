@@ -0,0 +1,138 @@
+"""Trusted construction of models from documents of our own indices.
+
+Documents in ES were written from these very models, so full pydantic validation only
+re-checks what is known to hold. A compiled decoder converts each field by its annotation
+(ISO dates, UUIDs, enums, nested models) and builds the model with ``construct()``.
+Anything unexpected falls back to regular validation, which raises as before.
+"""
+import datetime
+import logging
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Optional, TypeVar
+from uuid import UUID
+
+from pydantic import BaseModel, Extra
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
+
+from src.core import config
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+Converter = Callable[[Any], Any]
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _passthrough(value):
+    return value
+
+
+def _datetime(value):
+    return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+
+
+def _date(value):
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+
+
+def _uuid(value):
+    return value if isinstance(value, UUID) else UUID(value)
+
+
+def _str(value):
+    if isinstance(value, str):
+        return value
+    # Numbers are the only other values pydantic turns into strings
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError("non-str value needs validation")
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    raise TypeError("non-bool value needs validation")
+
+
+SCALAR_CONVERTERS: dict[type, Converter] = {
+    int: int,
+    float: float,
+    str: _str,
+    bool: _bool,
+    datetime.datetime: _datetime,
+    datetime.date: _date,
+    UUID: _uuid,
+}
+
+
+def _converter(field: ModelField) -> Optional[Converter]:
+    field_type = field.type_
+    if isinstance(field_type, type) and issubclass(field_type, BaseModel):
+        convert = model_decoder(field_type)
+    elif isinstance(field_type, type) and issubclass(field_type, Enum):
+        convert = field_type
+    else:
+        convert = SCALAR_CONVERTERS.get(field_type)
+    if convert is None or field.shape not in (SHAPE_SINGLETON, SHAPE_LIST):
+        return None
+
+    if field.shape == SHAPE_LIST:
+        item = convert
+
+        def convert(values):
+            return [item(value) for value in values]
+
+    if field.allow_none:
+        not_none = convert
+
+        def convert(value):
+            return None if value is None else not_none(value)
+
+    return convert
+
+
+def compile_decoder(model: type[ModelT]) -> Callable[[dict], ModelT]:
+    if model.__private_attributes__ or model.__config__.extra == Extra.allow:
+        return model.parse_obj
+
+    plan = []
+    for name, field in model.__fields__.items():
+        if (convert := _converter(field)) is None:
+            # A field type we don't know how to convert: this model is always validated
+            logger.debug("%s.%s has no trusted converter, using validation", model.__name__, name)
+            return model.parse_obj
+        plan.append((name, field.alias, convert, None if field.required else field.get_default))
+
+    new = model.__new__
+
+    def decode(doc: dict) -> ModelT:
+        values, fields_set = {}, set()
+        try:
+            for name, alias, convert, default in plan:
+                value = doc.get(alias, _MISSING)
+                if value is not _MISSING:
+                    values[name] = convert(value)
+                    fields_set.add(name)
+                elif default is None:
+                    raise KeyError(alias)
+                else:
+                    values[name] = default()
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return model.parse_obj(doc)
+        # What BaseModel.construct() does, without its per-call walk over the fields
+        instance = new(model)
+        object.__setattr__(instance, "__dict__", values)
+        object.__setattr__(instance, "__fields_set__", fields_set)
+        return instance
+
+    return decode
+
+
+@lru_cache(maxsize=None)
+def model_decoder(model: type[ModelT]) -> Callable[[dict], ModelT]:
+    """Returns the trusted decoder for ``model``, or plain validation with STRICT_MODEL_VALIDATION."""
+    if config.STRICT_MODEL_VALIDATION:
+        return model.parse_obj
+    return compile_decoder(model)
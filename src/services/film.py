@@ -1,24 +1,38 @@
 from functools import lru_cache
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from fastapi import Depends
+from pydantic import BaseModel
 
 from src.db.elastic import get_elastic
 from src.models.film import Film
-from src.services.base import BaseService
+from src.services.base import BaseService, Page
 from src.services.base_storage import BaseStorage
+from src.services.decoders import model_decoder
 
 
 class FilmService(BaseService):
     async def get(self, film_id: str) -> Optional[Film]:
         if doc := await super().get(film_id):
-            return Film(**doc["_source"])
+            return model_decoder(Film)(doc["_source"])
         return None
 
-    async def list(self, es_query: Optional[dict] = None) -> list[Film]:
+    async def get_many(self, entity_ids: list[str]) -> list[Optional[Film]]:
+        docs = await super().get_many(entity_ids)
+        decode = model_decoder(Film)
+        return [decode(doc["_source"]) if doc.get("found") else None for doc in docs]
+
+    async def export(self, es_query: dict) -> AsyncIterator[list[dict]]:
+        # Raw _source dicts: the export never builds Film objects
+        async for hits in self.iter_all(es_query):
+            yield [hit["_source"] for hit in hits]
+
+    async def list(self, es_query: Optional[dict] = None, model: type[BaseModel] = Film) -> Page[Film]:
+        # model is Film or a summary projection of it matching the query _source
         if docs := await super().list(es_query):
-            return [Film(**film["_source"]) for film in docs["hits"]["hits"]]
-        return []
+            decode = model_decoder(model)
+            return self.page(es_query, docs, [decode(film["_source"]) for film in docs["hits"]["hits"]])
+        return Page()
 
 
 @lru_cache()
@@ -2,27 +2,50 @@ from functools import lru_cache
 from typing import Optional
 
 from fastapi import Depends
+from pydantic import BaseModel
 
+from src.core import config
 from src.db.elastic import get_elastic
 from src.models.genre import Genre
-from src.services.base import BaseService
+from src.services.base import BaseService, Page
 from src.services.base_storage import BaseStorage
+from src.services.decoders import model_decoder
+from src.services.genre_catalog import GenreCatalog, genre_catalog
 
 
 class GenreService(BaseService):
+    def __init__(self, storage: BaseStorage, index: str, catalog: Optional[GenreCatalog] = None):
+        super().__init__(storage, index)
+        self.catalog = catalog
+
+    @property
+    def local(self) -> bool:
+        """Whether reads are served from the in-memory catalog rather than ES."""
+        return self.catalog is not None and self.catalog.ready
+
     async def get(self, film_id: str) -> Optional[Genre]:
+        if self.local:
+            return self.catalog.get(film_id)
         if doc := await super().get(film_id):
-            return Genre(**doc["_source"])
+            return model_decoder(Genre)(doc["_source"])
         return None
 
-    async def list(self, es_query: Optional[dict] = None) -> list[Genre]:
+    async def get_many(self, entity_ids: list[str]) -> list[Optional[Genre]]:
+        if self.local:
+            return self.catalog.get_many(entity_ids)
+        docs = await super().get_many(entity_ids)
+        decode = model_decoder(Genre)
+        return [decode(doc["_source"]) if doc.get("found") else None for doc in docs]
+
+    async def list(self, es_query: Optional[dict] = None, model: type[BaseModel] = Genre) -> Page[Genre]:
         if docs := await super().list(es_query):
-            return [Genre(**film["_source"]) for film in docs["hits"]["hits"]]
-        return []
+            decode = model_decoder(model)
+            return self.page(es_query, docs, [decode(film["_source"]) for film in docs["hits"]["hits"]])
+        return Page()
 
 
 @lru_cache()
 def get_genre_service(
     db: BaseStorage = Depends(get_elastic),  # noqa B008
 ) -> GenreService:
-    return GenreService(db, index="genres")
+    return GenreService(db, index="genres", catalog=genre_catalog if config.GENRE_CATALOG_ENABLED else None)
@@ -0,0 +1,180 @@
+"""The whole genres index held in process memory.
+
+There are a few hundred genres and they almost never change, so every worker keeps all of
+them, indexed by id, and serves details, sorted and paginated lists and fuzzy search without
+a network round trip. A background loop picks up changed documents by their ``modified``
+timestamp and now and then reloads everything, which also drops deleted genres.
+"""
+import asyncio
+import datetime
+import logging
+import re
+import time
+from typing import Optional
+
+from pydantic import BaseModel
+
+from src.core import config
+from src.models.genre import Genre
+from src.services.base import Page
+from src.services.base_storage import BaseStorage
+from src.services.decoders import model_decoder
+from src.utils import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.casefold())
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Damerau-Levenshtein distance <= 1, the ``fuzziness: 1`` of the ES query it replaces."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        # One substitution or one transposition of neighbours
+        return a[i + 1 :] == b[i + 1 :] or (a[i + 2 :] == b[i + 2 :] and a[i : i + 2] == b[i : i + 2][::-1])
+    # One insertion into the shorter word
+    return a[i:] == b[i + 1 :]
+
+
+class GenreCatalog:
+    def __init__(self, index: str = "genres"):
+        self.index = index
+        self.genres: dict[str, Genre] = {}
+        self.ready = False
+        self.loaded_at = 0.0
+        self._tokens: dict[str, list[str]] = {}
+        self._sorted: dict[tuple[tuple[str, ...], bool], list[Genre]] = {}
+        self._watermark: Optional[datetime.datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _fetch(self, storage: BaseStorage, query: Optional[dict] = None) -> list[Genre]:
+        es_query = {
+            "size": config.GENRE_CATALOG_PAGE_SIZE,
+            "sort": ["id:asc"],
+            "_source": list(Genre.__fields__),
+        }
+        if query:
+            es_query["query"] = {"query": query}
+        decode = model_decoder(Genre)
+        return [decode(hit["_source"]) async for hits in storage.iter_all(es_query, self.index) for hit in hits]
+
+    async def load(self, storage: BaseStorage):
+        """Replaces the catalog with a full copy of the index."""
+        genres = await self._fetch(storage)
+        self.genres = {str(genre.id): genre for genre in genres}
+        self._reindex()
+        self.ready = True
+        self.loaded_at = time.monotonic()
+        logger.info("Genre catalog loaded: %d genres", len(self.genres))
+
+    async def refresh(self, storage: BaseStorage):
+        """Applies the genres modified since the newest one already held."""
+        if self._watermark is None:
+            await self.load(storage)
+            return
+        # gte: documents sharing the watermark timestamp may have been indexed after the last refresh
+        changed = await self._fetch(storage, {"range": {"modified": {"gte": self._watermark.isoformat()}}})
+        if updated := [genre for genre in changed if self.genres.get(str(genre.id)) != genre]:
+            # Copy on write: requests in flight keep iterating the previous dict
+            self.genres = {**self.genres, **{str(genre.id): genre for genre in updated}}
+            self._reindex()
+            logger.info("Genre catalog refreshed: %d genres changed", len(updated))
+
+    def _reindex(self):
+        self._tokens = {genre_id: tokenize(genre.genre) for genre_id, genre in self.genres.items()}
+        self._sorted = {}
+        self._watermark = max((genre.modified for genre in self.genres.values()), default=None)
+
+    async def run(self, storage: BaseStorage):
+        """Loads the catalog and keeps it fresh until cancelled; failures keep the last good copy."""
+        while True:
+            try:
+                if not self.ready or time.monotonic() - self.loaded_at >= config.GENRE_CATALOG_RELOAD_INTERVAL:
+                    await self.load(storage)
+                else:
+                    await self.refresh(storage)
+            except Exception:
+                if self.ready:
+                    logger.warning("Genre catalog refresh failed, serving the previous copy", exc_info=True)
+                else:
+                    # Genres are read from ES until a later load succeeds
+                    logger.warning("Genre catalog load failed", exc_info=True)
+            await asyncio.sleep(config.GENRE_CATALOG_REFRESH_INTERVAL)
+
+    def start(self, storage: BaseStorage):
+        """Loads the catalog in the background: startup doesn't wait for ES, genres are read from it until then."""
+        self._task = asyncio.create_task(self.run(storage))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def get(self, genre_id: str) -> Optional[Genre]:
+        return self.genres.get(genre_id)
+
+    def get_many(self, genre_ids: list[str]) -> list[Optional[Genre]]:
+        return [self.genres.get(genre_id) for genre_id in genre_ids]
+
+    @staticmethod
+    def _key(genre: Genre, fields: list[str]) -> tuple:
+        return tuple(getattr(genre, field) for field in fields)
+
+    def _sorted_by(self, fields: list[str], descending: bool) -> list[Genre]:
+        order = (tuple(fields), descending)
+        if (ordered := self._sorted.get(order)) is None:
+            ordered = self._sorted[order] = sorted(
+                self.genres.values(), key=lambda genre: self._key(genre, fields), reverse=descending
+            )
+        return ordered
+
+    def list(
+        self,
+        search_query: str,
+        sort: list[str],
+        search_after: Optional[list],
+        offset: int,
+        limit: int,
+        model: type[BaseModel] = Genre,
+    ) -> Page:
+        """A page of genres ordered by ``sort`` (as built by keyset_sort), the way ES would return it."""
+        fields = [field.split(":")[0].removesuffix(".raw") for field in sort]
+        descending = sort[0].endswith(":desc")
+        genres = self._sorted_by(fields, descending)
+
+        if search_query:
+            terms = tokenize(search_query)
+            genres = [
+                genre
+                for genre in genres
+                if any(within_one_edit(term, token) for term in terms for token in self._tokens[str(genre.id)])
+            ]
+        if search_after is not None:
+            # Cursors issued while genres were read from ES may carry ids as strings
+            after = tuple(Genre.__fields__[field].type_(value) for field, value in zip(fields, search_after))
+            if descending:
+                genres = [genre for genre in genres if self._key(genre, fields) < after]
+            else:
+                genres = [genre for genre in genres if self._key(genre, fields) > after]
+
+        genres = genres[offset : offset + limit]
+        decode = model_decoder(model)
+        page = Page(genre if model is Genre else decode(genre.__dict__) for genre in genres)
+        if genres and len(genres) == limit:
+            page.next_cursor = encode_cursor(sort, list(self._key(genres[-1], fields)))
+        return page
+
+
+genre_catalog = GenreCatalog()
@@ -0,0 +1,88 @@
+"""Hedged reads: when a read is slower than almost all recent ones, race a second copy of it.
+
+A point read is normally answered in a few milliseconds; the slow ones are stuck behind a
+busy or garbage-collecting node. Sending the same read to another shard copy once the first
+is past the recent p95 bounds the tail at the cost of a few percent of extra reads.
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from src.core import config, metrics
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """Latencies of the last ``size`` calls, with their percentile recomputed every few samples."""
+
+    def __init__(self, size: int = 1000, refresh_every: int = 50):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._refresh_every = refresh_every
+        self._since_refresh = 0
+        self._percentiles: dict[float, float] = {}
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_refresh += 1
+        if self._since_refresh >= self._refresh_every:
+            self._since_refresh = 0
+            self._percentiles.clear()
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        if (value := self._percentiles.get(p)) is None:
+            ordered = sorted(self._samples)
+            value = self._percentiles[p] = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+        return value
+
+
+windows: dict[str, LatencyWindow] = {}
+
+
+def get_window(name: str) -> LatencyWindow:
+    if (window := windows.get(name)) is None:
+        window = windows[name] = LatencyWindow(config.ES_HEDGE_WINDOW)
+    return window
+
+
+async def timed(window: LatencyWindow, call: Awaitable[T]) -> T:
+    started = time.perf_counter()
+    result = await call
+    window.observe(time.perf_counter() - started)
+    return result
+
+
+async def hedged(name: str, read: Callable[[Optional[str]], Awaitable[T]]) -> T:
+    """Runs ``read(None)`` and, if it is still running after the hedge delay, ``read(preference)`` too.
+
+    The first answer wins and the other call is cancelled. A failed call doesn't end the race
+    while the other one may still succeed.
+    """
+    window = get_window(name)
+    delay = max(config.ES_HEDGE_MIN_DELAY, window.percentile(config.ES_HEDGE_PERCENTILE) or 0)
+    primary = asyncio.ensure_future(timed(window, read(None)))
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result()
+
+        metrics.ES_HEDGES.labels(name, "fired").inc()
+        # A custom preference string routes the read to a shard copy picked by its hash,
+        # usually not the one the adaptive replica selection gave the primary read
+        tasks.append(asyncio.ensure_future(timed(window, read(uuid.uuid4().hex))))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.ES_HEDGES.labels(name, "primary_won" if task is primary else "hedge_won").inc()
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -2,23 +2,31 @@ from functools import lru_cache
 from typing import Optional
 
 from fastapi import Depends
+from pydantic import BaseModel
 
 from src.db.elastic import get_elastic
 from src.models.person import Person
-from src.services.base import BaseService
+from src.services.base import BaseService, Page
 from src.services.base_storage import BaseStorage
+from src.services.decoders import model_decoder
 
 
 class PersonService(BaseService):
     async def get(self, film_id: str) -> Optional[Person]:
         if doc := await super().get(film_id):
-            return Person(**doc["_source"])
+            return model_decoder(Person)(doc["_source"])
         return None
 
-    async def list(self, es_query: Optional[dict] = None) -> list[Person]:
+    async def get_many(self, entity_ids: list[str]) -> list[Optional[Person]]:
+        docs = await super().get_many(entity_ids)
+        decode = model_decoder(Person)
+        return [decode(doc["_source"]) if doc.get("found") else None for doc in docs]
+
+    async def list(self, es_query: Optional[dict] = None, model: type[BaseModel] = Person) -> Page[Person]:
         if docs := await super().list(es_query):
-            return [Person(**film["_source"]) for film in docs["hits"]["hits"]]
-        return []
+            decode = model_decoder(model)
+            return self.page(es_query, docs, [decode(film["_source"]) for film in docs["hits"]["hits"]])
+        return Page()
 
 
 @lru_cache()
@@ -0,0 +1,63 @@
+"""Per-client token buckets kept in Redis, shared by all workers and instances.
+
+A bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per second; every request
+takes one. The refill and the take run in one Lua script, so concurrent requests of a client
+hitting different workers cannot both spend the last token. The script reads the Redis clock,
+so instances with skewed clocks refill a shared bucket at the same rate.
+"""
+import asyncio
+import hashlib
+
+from aioredis import Redis, ReplyError
+
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+-- Redis before 5.0 refuses writes after TIME unless the script replicates its effects
+redis.replicate_commands()
+local time = redis.call("time")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call("hmget", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("hset", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("pexpire", KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET_SCRIPT.encode()).hexdigest()
+
+
+class TokenBucketLimiter:
+    def __init__(self, redis: Redis, rate: float, burst: int, timeout: float = 0, prefix: str = "ratelimit"):
+        self.redis = redis
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.prefix = prefix
+
+    async def _eval(self, key: str) -> list:
+        args = [self.rate, self.burst]
+        try:
+            return await self.redis.evalsha(TOKEN_BUCKET_SHA, keys=[key], args=args)
+        except ReplyError as e:
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+            # First call after a Redis restart or failover: EVAL loads the script into its cache
+            return await self.redis.eval(TOKEN_BUCKET_SCRIPT, keys=[key], args=args)
+
+    async def take(self, client: str) -> float:
+        """Takes a token for ``client``; returns 0 if it got one, else seconds until the next one.
+
+        Raises CACHE_ERRORS when Redis is unavailable: the caller decides whether to fail open.
+        """
+        call = self._eval(f"{self.prefix}:{client}")
+        allowed, tokens = await (asyncio.wait_for(call, self.timeout) if self.timeout else call)
+        if allowed:
+            return 0.0
+        return (1 - float(tokens)) / self.rate
@@ -0,0 +1,35 @@
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import Depends
+
+from src.db.elastic import get_elastic
+from src.models.suggest import Suggestion, SuggestionType
+from src.services.base import BaseService
+from src.services.base_storage import BaseStorage
+
+
+class SuggestService(BaseService):
+    async def list(self, es_query: Optional[dict] = None) -> list[Suggestion]:
+        if docs := await super().list(es_query):
+            return [self.suggestion(hit) for hit in docs["hits"]["hits"]]
+        return []
+
+    @staticmethod
+    def suggestion(hit: dict) -> Suggestion:
+        # Hits are told apart by their fields: _index holds the concrete index name behind an alias
+        source = hit["_source"]
+        if "title" in source:
+            return Suggestion(id=source["id"], type=SuggestionType.FILM, title=source["title"])
+        if "genre" in source:
+            return Suggestion(id=source["id"], type=SuggestionType.GENRE, title=source["genre"])
+        name = " ".join(filter(None, (source.get("first_name"), source.get("last_name"))))
+        return Suggestion(id=source["id"], type=SuggestionType.PERSON, title=name)
+
+
+@lru_cache()
+def get_suggest_service(
+    db: BaseStorage = Depends(get_elastic),  # noqa B008
+) -> SuggestService:
+    # One search over all three indices
+    return SuggestService(db, index="movies,genres,people")
@@ -0,0 +1,65 @@
+"""Redis footprint and encode/decode latency of cached film pages per codec.
+
+    python -m src.tests.benchmarks.cache_compression [--pages 200] [--items 50]
+"""
+import argparse
+import time
+
+import orjson
+
+from src.services.base_cache import CacheEntry
+from src.services.cache_codecs import available_codecs
+from src.tests.functional.factories import MovieFactory
+
+
+def build_pages(pages: int, items: int) -> list[CacheEntry]:
+    return [
+        CacheEntry.create(orjson.dumps([MovieFactory.create().dict() for _ in range(items)]), soft_ttl=300)
+        for _ in range(pages)
+    ]
+
+
+def measure(entries: list[CacheEntry], codec, rounds: int) -> dict:
+    packed = [entry.pack(codec) for entry in entries]
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for entry in entries:
+            entry.pack(codec)
+    encode = (time.perf_counter() - started) / (rounds * len(entries))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for raw in packed:
+            CacheEntry.unpack(raw)
+    decode = (time.perf_counter() - started) / (rounds * len(entries))
+
+    return {"stored": sum(len(raw) for raw in packed), "encode": encode, "decode": decode}
+
+
+def main(pages: int, items: int, rounds: int):
+    entries = build_pages(pages, items)
+    raw_size = sum(len(entry.data) for entry in entries)
+    print(f"{pages} pages x {items} films, {raw_size / pages / 1024:.1f} KiB JSON per page")
+    print(f"{'codec':>10} {'level':>6} {'MiB total':>10} {'ratio':>7} {'encode us':>10} {'decode us':>10}")
+
+    candidates = [("none", None, None)]
+    for level in (1, 6):
+        for name, codec in available_codecs(level).items():
+            candidates.append((name, level, codec))
+
+    for name, level, codec in candidates:
+        result = measure(entries, codec, rounds)
+        print(
+            f"{name:>10} {level if level is not None else '-':>6} {result['stored'] / 2 ** 20:10.2f} "
+            f"{raw_size / result['stored']:7.2f} {result['encode'] * 1e6:10.1f} {result['decode'] * 1e6:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.pages, args.items, args.rounds)
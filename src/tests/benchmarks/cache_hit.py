@@ -0,0 +1,59 @@
+"""CPU cost of answering a cached 50-film page.
+
+Compares the old cache-hit path (orjson.loads -> response_model validation ->
+jsonable_encoder -> ORJSONResponse) with sending the cached bytes as is.
+
+    python -m src.tests.benchmarks.cache_hit [--items 50] [--rounds 2000]
+"""
+import argparse
+import asyncio
+import time
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.models.film import Film
+from src.tests.functional.factories import MovieFactory
+from src.utils import json_response
+
+
+async def pydantic_round_trip(field, raw: bytes):
+    content = await serialize_response(field=field, response_content=orjson.loads(raw))
+    return ORJSONResponse(content)
+
+
+async def raw_bytes(field, raw: bytes):
+    return json_response(raw)
+
+
+async def measure(handler, field, raw: bytes, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        await handler(field, raw)
+    return (time.process_time() - started) / rounds
+
+
+async def main(items: int, rounds: int):
+    movies = [MovieFactory.create() for _ in range(items)]
+    raw = orjson.dumps([movie.dict() for movie in movies])
+    field = create_response_field(name="Response_film_list", type_=list[Film])
+
+    print(f"{items} films, {len(raw) / 1024:.1f} KiB body, {rounds} rounds")
+    results = {}
+    for handler in (pydantic_round_trip, raw_bytes):
+        await measure(handler, field, raw, rounds=max(rounds // 10, 1))
+        results[handler.__name__] = await measure(handler, field, raw, rounds)
+        print(f"{handler.__name__:>20}: {results[handler.__name__] * 1e6:10.1f} us CPU/request")
+
+    saved = results["pydantic_round_trip"] - results["raw_bytes"]
+    print(f"{'saved':>20}: {saved * 1e6:10.1f} us CPU/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.rounds))
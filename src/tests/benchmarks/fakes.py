@@ -0,0 +1,268 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+import orjson
+from aioredis.parser import PyReader
+
+from src.services.base_cache import CacheEntry, RedisCache
+from src.services.base_storage import BaseStorage
+from src.services.cache_keys import generation_key
+from src.tests.functional.factories import GenreFactory, MovieFactory, PersonFactory
+
+
+class Latency:
+    def __init__(self, base_ms: float = 0, jitter_ms: float = 0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+
+    async def wait(self):
+        delay = self.base_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        # sleep(0) still yields to the loop like a real network call would
+        await asyncio.sleep(delay / 1000)
+
+
+def _sort_key(field: str):
+    def key(doc: dict):
+        value = doc.get(field)
+        return (value is None, value if value is not None else 0)
+
+    return key
+
+
+class InMemoryStorage(BaseStorage):
+    """BaseStorage over plain dicts with the subset of ES query semantics the routes use."""
+
+    def __init__(self, indices: dict[str, dict[str, dict]], latency: Optional[Latency] = None):
+        super().__init__(db=None)
+        self.indices = indices
+        self.latency = latency or Latency()
+        self.calls = 0
+
+    async def get_all(self, query: Optional[dict] = None, index: Optional[str] = None):
+        await self.latency.wait()
+        self.calls += 1
+        docs = list(self.indices.get(index, {}).values())
+
+        body = (query.get("query") or {}).get("query") or {}
+        if match := body.get("multi_match"):
+            needle = match["query"].lower()
+            fields = [field.split("^")[0] for field in match["fields"]]
+            docs = [doc for doc in docs if any(needle in str(doc.get(field, "")).lower() for field in fields)]
+
+        sort = [spec.split(":") for spec in query.get("sort", ["id:asc"])]
+        for field, order in reversed(sort):
+            docs.sort(key=_sort_key(field.removesuffix(".raw")), reverse=order == "desc")
+
+        if search_after := query.get("search_after"):
+            field, order = sort[0]
+            field = field.removesuffix(".raw")
+            after = search_after[0]
+            docs = [doc for doc in docs if (doc.get(field) > after if order == "asc" else doc.get(field) < after)]
+
+        start = query.get("from", 0)
+        page = docs[start : start + query.get("size", 10)]
+        fields = query.get("_source")
+        hits = [
+            {
+                "_id": str(doc["id"]),
+                "_source": {key: doc[key] for key in fields if key in doc} if fields else doc,
+                "sort": [doc.get(field.removesuffix(".raw")) for field, _ in sort],
+            }
+            for doc in page
+        ]
+        return {"took": 0, "hits": {"total": {"value": len(docs), "relation": "eq"}, "hits": hits}}
+
+    async def get_scalar(self, entity_id: str, index: Optional[str] = None):
+        await self.latency.wait()
+        self.calls += 1
+        if (doc := self.indices.get(index, {}).get(str(entity_id))) is None:
+            return None
+        return {"_id": str(entity_id), "_source": doc, "found": True}
+
+    async def get_many(self, entity_ids: list[str], index: Optional[str] = None) -> list[dict]:
+        await self.latency.wait()
+        self.calls += 1
+        docs = self.indices.get(index, {})
+        return [
+            {"_id": entity_id, "found": True, "_source": docs[entity_id]}
+            if entity_id in docs
+            else {"_id": entity_id, "found": False}
+            for entity_id in map(str, entity_ids)
+        ]
+
+
+class InMemoryRedisCache(RedisCache):
+    """Redis tier stand-in: stores packed envelopes in a dict, so encoding costs stay realistic."""
+
+    def __init__(self, latency: Optional[Latency] = None, codec=None, compress_min_bytes: int = 0):
+        super().__init__(redis=None, codec=codec, compress_min_bytes=compress_min_bytes)
+        self.latency = latency or Latency()
+        self._values: dict[str, tuple[float, bytes]] = {}
+
+    def _get(self, key: str) -> Optional[bytes]:
+        if (item := self._values.get(key)) is None:
+            return None
+        expires_at, raw = item
+        if expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        return raw
+
+    async def set_entry(self, key: str, entry: CacheEntry, ttl: int):
+        await self.latency.wait()
+        self._values[key] = (time.monotonic() + ttl, self.pack(entry))
+
+    async def get_entry(self, key: str) -> Optional[CacheEntry]:
+        await self.latency.wait()
+        if (raw := self._get(key)) is None or (entry := self.unpack(raw)) is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return entry
+
+    async def get_meta(self, key: str) -> Optional[CacheEntry]:
+        await self.latency.wait()
+        if (raw := self._get(key)) is None:
+            return None
+        return CacheEntry.unpack_meta(raw[: CacheEntry.meta_end(raw) or 0])
+
+    async def get_entries(self, keys: list[str]) -> list[Optional[CacheEntry]]:
+        await self.latency.wait()
+        entries = []
+        for key in keys:
+            raw = self._get(key)
+            entries.append(self.unpack(raw) if raw is not None else None)
+        return entries
+
+    async def set_entries(self, entries: dict[str, CacheEntry], ttl: int):
+        await self.latency.wait()
+        for key, entry in entries.items():
+            self._values[key] = (time.monotonic() + ttl, self.pack(entry))
+
+    async def delete(self, *keys: str):
+        await self.latency.wait()
+        for key in keys:
+            self._values.pop(key, None)
+
+    async def get_generation(self, namespace: str) -> int:
+        await self.latency.wait()
+        return int(self._get(generation_key(namespace)) or 0)
+
+    async def bump_generation(self, namespace: str) -> int:
+        generation = await self.get_generation(namespace) + 1
+        self._values[generation_key(namespace)] = (float("inf"), str(generation).encode())
+        return generation
+
+    async def acquire_lock(self, key: str, lease_ms: int) -> bool:
+        await self.latency.wait()
+        if self._get(f"lock:{key}") is not None:
+            return False
+        self._values[f"lock:{key}"] = (time.monotonic() + lease_ms / 1000, b"1")
+        return True
+
+    async def release_lock(self, key: str):
+        self._values.pop(f"lock:{key}", None)
+
+    async def clear(self):
+        self._values.clear()
+
+
+class RespServer:
+    """Local Redis stand-in speaking RESP over TCP, for benchmarks that need real aioredis connections.
+
+    Implements the commands RedisCache sends. Every reply is delayed by ``latency`` without holding
+    up the commands behind it, like a network round trip; replies keep the order of the commands.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.values: dict[bytes, bytes] = {}
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self) -> "RespServer":
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        parser = PyReader()
+        replies: asyncio.Queue = asyncio.Queue()
+        sender = asyncio.create_task(self._send(replies, writer))
+        try:
+            while data := await reader.read(65536):
+                parser.feed(data)
+                while (command := parser.gets()) is not False:
+                    self.commands += 1
+                    replies.put_nowait((asyncio.ensure_future(self.latency.wait()), self._execute(command)))
+        finally:
+            sender.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _send(replies: asyncio.Queue, writer: asyncio.StreamWriter):
+        while True:
+            delay, reply = await replies.get()
+            await delay
+            writer.write(reply)
+
+    def _execute(self, command: list[bytes]) -> bytes:
+        name, *args = command
+        name = name.upper()
+        if name in (b"PING", b"SELECT", b"FLUSHDB"):
+            if name == b"FLUSHDB":
+                self.values.clear()
+            return b"+OK\r\n" if name != b"PING" else b"+PONG\r\n"
+        if name == b"GET":
+            return _bulk(self.values.get(args[0]))
+        if name == b"GETRANGE":
+            value = self.values.get(args[0], b"")
+            return _bulk(value[int(args[1]) : int(args[2]) + 1])
+        if name == b"MGET":
+            return b"*%d\r\n" % len(args) + b"".join(_bulk(self.values.get(key)) for key in args)
+        if name == b"SET":
+            # Expiry options are accepted and ignored, NX is honoured for locks
+            if b"NX" in args[2:] and args[0] in self.values:
+                return b"$-1\r\n"
+            self.values[args[0]] = args[1]
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(self.values.pop(key, None) is not None for key in args)
+        if name == b"INCR":
+            value = int(self.values.get(args[0], b"0")) + 1
+            self.values[args[0]] = str(value).encode()
+            return b":%d\r\n" % value
+        if name == b"EVAL":
+            return b":0\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def build_indices(films: int, genres: int, people: int) -> dict[str, dict[str, dict]]:
+    indices = {"movies": {}, "genres": {}, "people": {}}
+    for film_id in range(1, films + 1):
+        movie = MovieFactory.create()
+        movie.id = film_id
+        indices["movies"][str(film_id)] = orjson.loads(movie.json())
+    for genre_id in range(1, genres + 1):
+        genre = GenreFactory.create()
+        genre.id = genre_id
+        indices["genres"][str(genre_id)] = orjson.loads(genre.json())
+    for _ in range(people):
+        person = orjson.loads(PersonFactory.create().json())
+        indices["people"][person["id"]] = person
+    return indices
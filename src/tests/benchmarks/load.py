@@ -0,0 +1,199 @@
+"""Load test of the real FastAPI app against in-process storage and cache fakes.
+
+Drives mixed film/genre/person traffic with a hot/cold key distribution and reports
+throughput, latency percentiles and memory allocated per request.
+
+    python -m src.tests.benchmarks.load --requests 5000 --concurrency 50 --es-latency-ms 5
+    python -m src.tests.benchmarks.load --save baseline.json
+    python -m src.tests.benchmarks.load --compare baseline.json --tolerance 10
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Optional
+from unittest.mock import patch
+
+import orjson
+from httpx import ASGITransport, AsyncClient
+
+from src.core import config
+from src.db.elastic import get_elastic
+from src.main import app
+from src.services.base_cache import InMemoryCache, TwoTierCache
+from src.tests.benchmarks.fakes import InMemoryRedisCache, InMemoryStorage, Latency, build_indices
+
+BASE_URL = f"http://bench{config.API_V1_PREFIX}"
+
+
+class Traffic:
+    """Picks request paths: a small hot set gets most of the traffic, the rest is spread uniformly."""
+
+    def __init__(self, indices: dict, hot_ratio: float, hot_keys: int, seed: int):
+        self.random = random.Random(seed)
+        self.hot_ratio = hot_ratio
+        self.ids = {index: list(docs) for index, docs in indices.items()}
+        self.hot = {index: ids[:hot_keys] for index, ids in self.ids.items()}
+        self.mix: list[tuple[float, Callable[[], str]]] = [
+            (0.35, lambda: f"/films/{self.pick('movies')}"),
+            (0.20, self.film_list),
+            (0.05, lambda: f"/films/?search_query={self.random.choice(['the', 'love', 'war', 'star'])}"),
+            (0.10, lambda: "/genres/"),
+            (0.10, lambda: f"/genres/{self.pick('genres')}"),
+            (0.15, lambda: f"/people/{self.pick('people')}"),
+            (0.05, lambda: "/people/?limit=20"),
+        ]
+        self.weights = [weight for weight, _ in self.mix]
+
+    def pick(self, index: str) -> str:
+        pool = self.hot[index] if self.random.random() < self.hot_ratio else self.ids[index]
+        return self.random.choice(pool)
+
+    def film_list(self) -> str:
+        page = 1 if self.random.random() < self.hot_ratio else self.random.randint(2, 20)
+        sort = self.random.choice(["id", "title"])
+        return f"/films/?sort={sort}&page={page}&limit=50"
+
+    def next_path(self) -> str:
+        _, build = self.random.choices(self.mix, weights=self.weights)[0]
+        return build()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_load(client: AsyncClient, traffic: Traffic, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    paths = [traffic.next_path() for _ in range(requests)]
+    queue = iter(paths)
+
+    async def worker():
+        for path in queue:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def measure_allocations(client: AsyncClient, traffic: Traffic, samples: int) -> dict:
+    tracemalloc.start()
+    peaks, blocks = [], []
+    try:
+        for _ in range(samples):
+            path = traffic.next_path()
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            snapshot_before = sys.getallocatedblocks()
+            await client.get(path)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(max(peak - before, 0))
+            blocks.append(sys.getallocatedblocks() - snapshot_before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kib_per_request": statistics.fmean(peaks) / 1024,
+        "retained_blocks_per_request": statistics.fmean(blocks),
+    }
+
+
+async def benchmark(args) -> dict:
+    indices = build_indices(args.films, args.genres, args.people)
+    storage = InMemoryStorage(indices, Latency(args.es_latency_ms, args.es_jitter_ms))
+    remote = InMemoryRedisCache(Latency(args.redis_latency_ms, args.redis_jitter_ms))
+    local = InMemoryCache(config.LOCAL_CACHE_MAX_ENTRIES, config.LOCAL_CACHE_MAX_BYTES, config.LOCAL_CACHE_TTL)
+    cache = TwoTierCache(local, remote)
+    if args.no_local_cache:
+        local.ttl = 0
+    traffic = Traffic(indices, args.hot_ratio, args.hot_keys, args.seed)
+
+    app.dependency_overrides[get_elastic] = lambda: storage
+    try:
+        with patch("src.utils.get_cache", return_value=cache):
+            transport = ASGITransport(app=app, raise_app_exceptions=False)
+            async with AsyncClient(transport=transport, base_url=BASE_URL) as client:
+                await run_load(client, traffic, min(args.requests // 10, 500), args.concurrency)  # warm-up
+                result = await run_load(client, traffic, args.requests, args.concurrency)
+                result.update(await measure_allocations(client, traffic, args.alloc_samples))
+    finally:
+        app.dependency_overrides.pop(get_elastic, None)
+
+    result["storage_calls"] = storage.calls
+    result["cache"] = cache.stats()
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    if result["rps"] < baseline["rps"] * (1 - tolerance / 100):
+        regressions.append(f"rps {result['rps']:.0f} < baseline {baseline['rps']:.0f}")
+    for key in ("p50_ms", "p95_ms", "p99_ms", "peak_kib_per_request"):
+        if result[key] > baseline[key] * (1 + tolerance / 100):
+            regressions.append(f"{key} {result[key]:.2f} > baseline {baseline[key]:.2f}")
+    return regressions
+
+
+def report(result: dict, baseline: Optional[dict]):
+    for key in ("rps", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "peak_kib_per_request", "retained_blocks_per_request"):
+        line = f"{key:>28}: {result[key]:10.2f}"
+        if baseline and key in baseline and baseline[key]:
+            line += f"   ({(result[key] / baseline[key] - 1) * 100:+.1f}% vs baseline)"
+        print(line)
+    print(f"{'statuses':>28}: {result['statuses']}")
+    print(f"{'storage calls':>28}: {result['storage_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--films", type=int, default=2000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--people", type=int, default=1000)
+    parser.add_argument("--hot-ratio", type=float, default=0.8, help="share of requests hitting the hot key set")
+    parser.add_argument("--hot-keys", type=int, default=20, help="hot key set size per index")
+    parser.add_argument("--es-latency-ms", type=float, default=5)
+    parser.add_argument("--es-jitter-ms", type=float, default=5)
+    parser.add_argument("--redis-latency-ms", type=float, default=0.5)
+    parser.add_argument("--redis-jitter-ms", type=float, default=0.5)
+    parser.add_argument("--no-local-cache", action="store_true", help="disable the in-process cache tier")
+    parser.add_argument("--alloc-samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", type=Path, help="write the result as a baseline JSON file")
+    parser.add_argument("--compare", type=Path, help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=10, help="allowed regression, percent")
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark(args))
+    baseline = orjson.loads(args.compare.read_bytes()) if args.compare else None
+    report(result, baseline)
+
+    if args.save:
+        args.save.write_bytes(orjson.dumps({**result, "args": vars(args)}, default=str, option=orjson.OPT_INDENT_2))
+    if baseline and (regressions := compare(result, baseline, args.tolerance)):
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
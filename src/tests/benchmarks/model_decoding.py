@@ -0,0 +1,58 @@
+"""Per-page cost of building models from ES hits: pydantic validation vs the trusted decoder.
+
+Each row times turning one page of ``_source`` dicts into models, and the same plus
+rendering the cached body (``.dict()`` + orjson) the way ``cached()`` does on a miss.
+
+    python -m src.tests.benchmarks.model_decoding [--items 50] [--rounds 200]
+"""
+import argparse
+import time
+
+import orjson
+
+from src.models.film import Film, FilmSummary
+from src.models.genre import Genre
+from src.models.person import Person
+from src.services.decoders import compile_decoder
+from src.tests.functional.factories import GenreFactory, MovieFactory, PersonFactory
+
+
+def build_sources(items: int) -> dict[type, list[dict]]:
+    films = [orjson.loads(MovieFactory.create().json()) for _ in range(items)]
+    return {
+        Film: films,
+        FilmSummary: [{name: film[name] for name in FilmSummary.__fields__} for film in films],
+        Genre: [orjson.loads(GenreFactory.create().json()) for _ in range(items)],
+        Person: [orjson.loads(PersonFactory.create().json()) for _ in range(items)],
+    }
+
+
+def per_page(build, sources: list[dict], rounds: int, render: bool) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        models = [build(source) for source in sources]
+        if render:
+            orjson.dumps([model.dict() for model in models])
+    return (time.perf_counter() - started) / rounds
+
+
+def main(items: int, rounds: int):
+    print(f"{items} hits per page, ms per page")
+    print(f"{'model':>12} {'validate':>9} {'decode':>9} {'speedup':>8} {'+render':>9} {'+render':>9} {'speedup':>8}")
+    for model, sources in build_sources(items).items():
+        decode = compile_decoder(model)
+        assert [decode(source) for source in sources] == [model.parse_obj(source) for source in sources]
+        row = []
+        for render in (False, True):
+            validated = per_page(model.parse_obj, sources, rounds, render)
+            decoded = per_page(decode, sources, rounds, render)
+            row.append(f"{validated * 1000:9.3f} {decoded * 1000:9.3f} {validated / decoded:7.1f}x")
+        print(f"{model.__name__:>12} {' '.join(row)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    main(args.items, args.rounds)
@@ -0,0 +1,102 @@
+"""Cache throughput at different Redis pool sizes, against a local RESP stand-in.
+
+Each worker coroutine replays what cached endpoints send: generation and entry reads
+(plain commands shared by all connections) and, for a share of them, a pipelined batch
+write, which checks a connection out of the pool for itself.
+
+    python -m src.tests.benchmarks.redis_pool [--sizes 1,2,5,10,20,50] [--concurrency 200] [--rtt-ms 1]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from src.core import metrics
+from src.db.redis import InstrumentedPool, create_pool
+from src.services.base_cache import CACHE_ERRORS, CacheEntry, RedisCache
+from src.tests.benchmarks.fakes import Latency, RespServer
+
+BODY = b"x" * 2048
+
+
+async def worker(cache: RedisCache, keys: list[str], batch_share: float, until: float, latencies: list[float]):
+    rnd = random.Random()
+    errors = 0
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        try:
+            await cache.get_generation("movies")
+            if rnd.random() < batch_share:
+                batch = rnd.sample(keys, 10)
+                await cache.set_entries({key: CacheEntry.create(BODY) for key in batch}, 60)
+            else:
+                await cache.get_entry(rnd.choice(keys))
+        except CACHE_ERRORS:
+            # The endpoint would fall back to storage here; a rejection raises without yielding
+            errors += 1
+            await asyncio.sleep(0)
+            continue
+        latencies.append(time.perf_counter() - started)
+    return errors
+
+
+async def run(size: int, concurrency: int, seconds: float, batch_share: float, rtt_ms: float) -> dict:
+    server = await RespServer(Latency(rtt_ms)).start()
+    redis = await create_pool(server.address, minsize=size, maxsize=size)
+    pool: InstrumentedPool = redis.connection
+    cache = RedisCache(redis)
+    keys = [f"bench:{i}" for i in range(1000)]
+    await cache.set_entries({key: CacheEntry.create(BODY) for key in keys}, 60)
+
+    wait = metrics.REDIS_POOL_WAIT.labels()
+    rejections = metrics.REDIS_POOL_REJECTIONS.labels()
+    wait_sum, wait_count, rejected = wait.sum, wait.count, rejections.value
+    latencies: list[float] = []
+    peak_waiting = 0
+    until = time.perf_counter() + seconds
+    workers = [asyncio.ensure_future(worker(cache, keys, batch_share, until, latencies)) for _ in range(concurrency)]
+    while not all(task.done() for task in workers):
+        peak_waiting = max(peak_waiting, pool.waiting)
+        await asyncio.sleep(0.01)
+    errors = sum(task.result() for task in workers)
+
+    redis.close()
+    await redis.wait_closed()
+    await server.stop()
+    checkouts = wait.count - wait_count
+    latencies.sort()
+    return {
+        "pool": size,
+        "ops_per_s": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "checkout_wait_ms": (wait.sum - wait_sum) / checkouts * 1000 if checkouts else 0.0,
+        "peak_waiting": peak_waiting,
+        "rejected": int(rejections.value - rejected),
+        "errors": errors,
+    }
+
+
+async def main(sizes: list[int], concurrency: int, seconds: float, batch_share: float, rtt_ms: float):
+    print(f"{concurrency} workers, {batch_share:.0%} pipelined batch writes, {rtt_ms} ms RTT, {seconds}s per size")
+    columns = ("pool", "ops_per_s", "p50_ms", "p99_ms", "checkout_wait_ms", "peak_waiting", "rejected", "errors")
+    print(" ".join(f"{column:>16}" for column in columns))
+    for size in sizes:
+        row = await run(size, concurrency, seconds, batch_share, rtt_ms)
+        cells = (
+            f"{row[column]:>16.2f}" if isinstance(row[column], float) else f"{row[column]:>16}" for column in columns
+        )
+        print(" ".join(cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,2,5,10,20,50")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--batch-share", type=float, default=0.1)
+    parser.add_argument("--rtt-ms", type=float, default=1)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    asyncio.run(main(sizes, args.concurrency, args.seconds, args.batch_share, args.rtt_ms))
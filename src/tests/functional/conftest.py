@@ -10,7 +10,7 @@ from httpx import AsyncClient
 from multidict import CIMultiDictProxy
 
 from src.db import elastic, redis
-from src.db.redis import get_redis
+from src.db.redis import get_cache
 from src.main import app
 from src.tests.functional.factories import MovieFactory
 from src.tests.functional.settings import TestSettings, get_settings
@@ -68,7 +68,7 @@ async def settings():
 
 @pytest.fixture
 async def cache_client():
-    redis_client = get_redis()
+    redis_client = get_cache()
     yield redis_client
     await redis_client.clear()
 
@@ -6,6 +6,9 @@ from src.core.config import API_V1_PREFIX
 
 
 class TestSettings(BaseSettings):
+    # Not a test class, though pytest collects it by name wherever it is imported
+    __test__ = False
+
     base_url: str = Field(f"http://{API_V1_PREFIX}", env="BASE_URL")
     es_host: str = Field("http://127.0.0.1:9200", env="ELASTIC_HOST")
     redis_host: str = "localhost"
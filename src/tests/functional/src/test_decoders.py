@@ -0,0 +1,31 @@
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from src.models.film import Film
+from src.services.decoders import compile_decoder
+from src.tests.functional.factories import MovieFactory
+
+
+@pytest.fixture
+def doc() -> dict:
+    return orjson.loads(MovieFactory.create().json())
+
+
+def test_decode_matches_validation(doc: dict):
+    assert compile_decoder(Film)(doc) == Film.parse_obj(doc)
+
+
+def test_decode_coerces_numbers_like_validation(doc: dict):
+    doc["title"] = 1984
+
+    assert compile_decoder(Film)(doc).title == Film.parse_obj(doc).title == "1984"
+
+
+@pytest.mark.parametrize("value", [None, ["a", "b"], {"ru": "Фильм"}])
+def test_decode_validates_non_str(doc: dict, value):
+    # Anything pydantic would reject must not be cached as its repr
+    doc["description"] = value
+
+    with pytest.raises(ValidationError):
+        compile_decoder(Film)(doc)
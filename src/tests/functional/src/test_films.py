@@ -1,16 +1,31 @@
+import asyncio
+import time
+from collections import Counter
 from http import HTTPStatus
-from unittest.mock import patch
+from typing import Optional
+from unittest.mock import AsyncMock, patch
 
 import orjson
 import pytest
+from aioredis import RedisError
 from elasticsearch import AsyncElasticsearch
 from httpx import AsyncClient
 
+from src.core import config, metrics
+from src.db.elastic import get_elastic
+from src.db.redis import create_pool
+from src.main import app
 from src.models.film import Film
-from src.services.base_cache import RedisCache
+from src.services.base_cache import CacheEntry, RedisCache, TwoTierCache
+from src.services.base_storage import ElasticsearchStorage
+from src.services.cache_keys import detail_key, list_key
+from src.services.circuit_breaker import breakers, get_breaker
 from src.tests.functional.constants import FILM_LIST_URL
 from src.tests.functional.factories import MovieFactory
-from src.tests.functional.utils.es_helpers import populate_es_from_factory
+from src.tests.functional.settings import TestSettings
+from src.tests.functional.utils.es_helpers import SlowElasticsearch, populate_es_from_factory
+from src.utils import invalidate_cache
+from src.warmup import claim_warm_up, warm_up
 
 # All test coroutines will be treated as marked.
 pytestmark = pytest.mark.asyncio
@@ -87,6 +102,42 @@ async def test_film_list_limit_page_2(client: AsyncClient, es_client: AsyncElast
     assert resp_json[0]["title"] == movies[2].title
 
 
+async def test_film_list_cursor(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = sorted([MovieFactory.create() for _ in range(10)], key=lambda movie: movie.id)
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+
+    response = await client.get(f"{FILM_LIST_URL}?sort_order=asc&sort=id&limit=2")
+    next_cursor = response.headers["X-Next-Cursor"]
+    response = await client.get(f"{FILM_LIST_URL}?sort_order=asc&sort=id&limit=2&cursor={next_cursor}")
+    resp_json = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert len(resp_json) == 2
+    assert resp_json[0]["title"] == movies[2].title
+
+
+async def test_film_list_cursor_sort_mismatch(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = [MovieFactory.create() for _ in range(3)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+
+    response = await client.get(f"{FILM_LIST_URL}?sort=id&limit=1")
+    next_cursor = response.headers["X-Next-Cursor"]
+    response = await client.get(f"{FILM_LIST_URL}?sort=title&limit=1&cursor={next_cursor}")
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+async def test_film_list_summary_view(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = [MovieFactory.create() for _ in range(3)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+
+    response = await client.get(f"{FILM_LIST_URL}?view=summary")
+    resp_json = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert all(set(item) == {"id", "title", "rating", "type", "creation_date"} for item in resp_json)
+
+
 async def test_film_list_search(client: AsyncClient, es_client: AsyncElasticsearch):
     movies = [MovieFactory.create() for _ in range(10)]
     await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
@@ -99,9 +150,9 @@ async def test_film_list_search(client: AsyncClient, es_client: AsyncElasticsear
 
 
 @patch("src.services.film.get_film_service")
-async def test_film_list_from_cache(mock_service, client: AsyncClient, cache_client: RedisCache):
+async def test_film_list_from_cache(mock_service, client: AsyncClient, cache_client: TwoTierCache):
     movies = [MovieFactory.create() for _ in range(10)]
-    cache_key = ":asc:id:1:50"
+    cache_key = list_key("movies", await cache_client.get_generation("movies"), {})
     await cache_client.cache(cache_key, orjson.dumps([entity.dict() for entity in movies]))
     # Fetch data from cache
     response = await client.get(FILM_LIST_URL)
@@ -113,10 +164,58 @@ async def test_film_list_from_cache(mock_service, client: AsyncClient, cache_cli
     mock_service.assert_not_called()
 
 
+@pytest.mark.parametrize("genres_nested", [False, True])
+async def test_film_list_facets(
+    client: AsyncClient, es_client: AsyncElasticsearch, cache_client: TwoTierCache, genres_nested: bool
+):
+    # Keyed by id: a repeated random id would overwrite a document and skew the counts
+    movies = list({movie.id: movie for movie in (MovieFactory.create() for _ in range(6))}.values())
+    # The dynamic mapping the ETL index gets, with genres made nested in the second run
+    mappings = {"properties": {"genres": {"type": "nested"}}} if genres_nested else None
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies", mappings=mappings)
+
+    with patch("src.core.config.ES_FILM_GENRES_NESTED", genres_nested):
+        response = await client.get(f"{FILM_LIST_URL}?facets=true&track_total_hits=true&limit=2")
+    resp_json = response.json()
+    facets = {
+        name: {bucket["key"]: bucket["count"] for bucket in buckets} for name, buckets in resp_json["facets"].items()
+    }
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["X-Total-Count"] == str(len(movies))
+    assert resp_json["total"] == {"value": len(movies), "relation": "eq"}
+    assert len(resp_json["items"]) == 2
+    assert facets["genre"] == Counter(genre.id for movie in movies for genre in movie.genres)
+    assert facets["type"] == Counter(movie.type.value for movie in movies)
+    assert facets["rating"] == Counter(float(movie.rating) for movie in movies)
+    # Years come back as key_as_string in the yyyy format, not as epoch millis
+    assert facets["year"] == Counter(str(movie.creation_date.year) for movie in movies)
+
+
 @patch("src.services.film.get_film_service")
-async def test_film_details_from_cache(mock_service, client: AsyncClient, cache_client: RedisCache, movie: Film):
+async def test_film_list_facets_from_cache(mock_service, client: AsyncClient, cache_client: TwoTierCache):
+    movies = [MovieFactory.create() for _ in range(3)]
+    body = {
+        "total": {"value": 3, "relation": "eq"},
+        "items": [entity.dict() for entity in movies],
+        "facets": {"type": [{"key": "movie", "count": 3}]},
+    }
+    cache_key = list_key("movies", await cache_client.get_generation("movies"), {"facets": True})
+    await cache_client.cache(cache_key, orjson.dumps(body))
+
+    response = await client.get(f"{FILM_LIST_URL}?facets=true")
+    resp_json = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert len(resp_json["items"]) == len(movies)
+    assert resp_json["facets"]["type"] == [{"key": "movie", "count": 3}]
+    mock_service.assert_not_called()
+
+
+@patch("src.services.film.get_film_service")
+async def test_film_details_from_cache(mock_service, client: AsyncClient, cache_client: TwoTierCache, movie: Film):
     film_details_url = f"/films/{movie.id}"
-    cache_key = f"film:{movie.id}"
+    cache_key = detail_key("movies", movie.id)
     await cache_client.cache(cache_key, movie.json())
     # Fetch data from cache
     response = await client.get(film_details_url)
@@ -126,3 +225,284 @@ async def test_film_details_from_cache(mock_service, client: AsyncClient, cache_
     assert film.title == movie.title
     assert film.type == movie.type
     mock_service.assert_not_called()
+
+
+@patch("src.services.film.get_film_service")
+async def test_film_details_from_local_cache(
+    mock_service, client: AsyncClient, cache_client: TwoTierCache, movie: Film
+):
+    film_details_url = f"/films/{movie.id}"
+    await cache_client.cache(detail_key("movies", movie.id), movie.json())
+    await cache_client.remote.clear()
+    # Fetch data from in-process cache
+    response = await client.get(film_details_url)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["title"] == movie.title
+    mock_service.assert_not_called()
+
+
+async def test_film_details_stale_while_revalidate(
+    client: AsyncClient, es_client: AsyncElasticsearch, cache_client: TwoTierCache, movie: Film
+):
+    await populate_es_from_factory(es_client=es_client, entities=[movie], index="movies")
+    stale_movie = movie.copy(update={"title": "stale title"})
+    stale_entry = CacheEntry(data=stale_movie.json().encode(), soft_expires_at=time.time() - 1)
+    await cache_client.set_entry(detail_key("movies", movie.id), stale_entry, ttl=60)
+    # Stale value is served immediately and refreshed in background
+    response = await client.get(f"/films/{movie.id}")
+    assert response.json()["title"] == stale_movie.title
+
+    await asyncio.sleep(0.5)
+    response = await client.get(f"/films/{movie.id}")
+    assert response.json()["title"] == movie.title
+
+
+async def test_film_details_single_flight(
+    client: AsyncClient, es_client: AsyncElasticsearch, cache_client: TwoTierCache, movie: Film
+):
+    await populate_es_from_factory(es_client=es_client, entities=[movie], index="movies")
+    get_scalar = ElasticsearchStorage.get_scalar
+    calls = 0
+
+    async def counted(self, entity_id: str, index: Optional[str] = None):
+        nonlocal calls
+        calls += 1
+        # Keeps the first lookup in flight while the other requests arrive
+        await asyncio.sleep(0.1)
+        return await get_scalar(self, entity_id, index)
+
+    with patch.object(ElasticsearchStorage, "get_scalar", counted):
+        responses = await asyncio.gather(*(client.get(f"/films/{movie.id}") for _ in range(50)))
+
+    assert {response.status_code for response in responses} == {HTTPStatus.OK}
+    assert {response.json()["id"] for response in responses} == {movie.id}
+    assert calls == 1
+
+
+async def test_film_details_waits_for_peer_lock(client: AsyncClient, cache_client: TwoTierCache, movie: Film):
+    cache_key = detail_key("movies", movie.id)
+    # Another worker holds the lock and is about to store the entry
+    assert await cache_client.acquire_lock(cache_key, 3000)
+
+    async def peer():
+        await asyncio.sleep(0.1)
+        await cache_client.cache(cache_key, movie.json())
+
+    try:
+        with patch("src.core.config.CACHE_LOCK_ENABLED", True), patch.object(
+            ElasticsearchStorage, "get_scalar"
+        ) as get_scalar:
+            response, _ = await asyncio.gather(client.get(f"/films/{movie.id}"), peer())
+    finally:
+        await cache_client.release_lock(cache_key)
+
+    assert response.status_code == HTTPStatus.OK
+    assert Film.parse_obj(response.json()) == movie
+    get_scalar.assert_not_called()
+
+
+async def test_film_details_not_modified(client: AsyncClient, es_client: AsyncElasticsearch, movie: Film):
+    await populate_es_from_factory(es_client=es_client, entities=[movie], index="movies")
+    response = await client.get(f"/films/{movie.id}")
+    etag = response.headers["ETag"]
+    assert "max-age" in response.headers["Cache-Control"]
+
+    response = await client.get(f"/films/{movie.id}", headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = await client.get(f"/films/{movie.id}", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == HTTPStatus.OK
+
+
+async def test_film_batch(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = [MovieFactory.create() for _ in range(3)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+    ids = [str(movies[1].id), "-1", str(movies[0].id)]
+
+    response = await client.post(f"{FILM_LIST_URL}batch", json={"ids": ids})
+    resp_json = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [item["id"] for item in resp_json] == ids
+    assert [item["found"] for item in resp_json] == [True, False, True]
+    assert resp_json[0]["data"]["title"] == movies[1].title
+
+
+async def test_film_batch_stale_while_revalidate(
+    client: AsyncClient, es_client: AsyncElasticsearch, cache_client: TwoTierCache, movie: Film
+):
+    await populate_es_from_factory(es_client=es_client, entities=[movie], index="movies")
+    stale_movie = movie.copy(update={"title": "stale title"})
+    stale_entry = CacheEntry(data=stale_movie.json().encode(), soft_expires_at=time.time() - 1)
+    await cache_client.set_entry(detail_key("movies", movie.id), stale_entry, ttl=60)
+    # Stale value is served immediately and refreshed in background
+    response = await client.post(f"{FILM_LIST_URL}batch", json={"ids": [str(movie.id)]})
+    assert response.json()[0]["data"]["title"] == stale_movie.title
+
+    await asyncio.sleep(0.5)
+    response = await client.post(f"{FILM_LIST_URL}batch", json={"ids": [str(movie.id)]})
+    assert response.json()[0]["data"]["title"] == movie.title
+
+
+async def test_film_batch_cache_unavailable(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = [MovieFactory.create() for _ in range(2)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+    cache = AsyncMock(spec=TwoTierCache)
+    cache.get_entries.side_effect = RedisError("connection lost")
+    cache.set_entries.side_effect = RedisError("connection lost")
+
+    with patch("src.utils.get_cache", return_value=cache):
+        response = await client.post(f"{FILM_LIST_URL}batch", json={"ids": [str(movie.id) for movie in movies]})
+
+    assert response.status_code == HTTPStatus.OK
+    assert [item["data"]["title"] for item in response.json()] == [movie.title for movie in movies]
+
+
+async def test_film_batch_pool_saturated(client: AsyncClient, es_client: AsyncElasticsearch, settings: TestSettings):
+    movies = [MovieFactory.create() for _ in range(2)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+    pool = await create_pool((settings.redis_host, settings.redis_port), minsize=1, maxsize=1)
+    pool.connection.max_waiters = 1
+    cache = RedisCache(pool)
+    rejections = metrics.REDIS_POOL_REJECTIONS.labels()
+    rejected = rejections.value
+    try:
+        # Another request's pipeline holds the only connection and one more checkout waits for it
+        async with pool.connection.get():
+            waiting = asyncio.ensure_future(cache.set_entries({"waiting": CacheEntry.create(b"{}")}, 60))
+            await asyncio.sleep(0.01)
+            with patch("src.utils.get_cache", return_value=cache):
+                response = await client.post(f"{FILM_LIST_URL}batch", json={"ids": [str(movie.id) for movie in movies]})
+        await waiting
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [item["data"]["title"] for item in response.json()] == [movie.title for movie in movies]
+    assert rejections.value > rejected
+
+
+async def test_film_export(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = sorted([MovieFactory.create() for _ in range(5)], key=lambda movie: movie.id)
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+
+    response = await client.get(f"{FILM_LIST_URL}export?fields=id,title")
+    rows = [orjson.loads(line) for line in response.content.splitlines()]
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert rows == [{"id": movie.id, "title": movie.title} for movie in movies]
+
+
+async def test_film_export_unknown_field(client: AsyncClient):
+    response = await client.get(f"{FILM_LIST_URL}export?fields=id,nope")
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+async def test_person_films(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = [MovieFactory.create() for _ in range(3)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+    person = movies[0].people[0]
+
+    response = await client.get(f"/people/{person.id}/films")
+    resp_json = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert [item["id"] for item in resp_json] == [movies[0].id]
+    assert set(resp_json[0]) == {"id", "title", "rating", "type", "creation_date"}
+
+
+async def test_genre_films(client: AsyncClient, es_client: AsyncElasticsearch):
+    movies = [MovieFactory.create() for _ in range(3)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+    genre = movies[1].genres[0]
+
+    response = await client.get(f"/genres/{genre.id}/films")
+
+    assert response.status_code == HTTPStatus.OK
+    assert movies[1].id in [item["id"] for item in response.json()]
+
+
+async def test_film_list_cache_key_normalized(client: AsyncClient, cache_client: TwoTierCache):
+    movies = [MovieFactory.create() for _ in range(2)]
+    params = {"search_query": "star wars", "limit": 2}
+    cache_key = list_key("movies", await cache_client.get_generation("movies"), params)
+    await cache_client.cache(cache_key, orjson.dumps([entity.dict() for entity in movies]))
+
+    response = await client.get(f"{FILM_LIST_URL}?search_query=Star%20%20Wars&limit=2")
+    assert len(response.json()) == len(movies)
+
+    await cache_client.bump_generation("movies")
+    assert list_key("movies", await cache_client.get_generation("movies"), params) != cache_key
+
+
+async def test_invalidate_cache(cache_client: TwoTierCache, movie: Film):
+    cache_key = detail_key("movies", movie.id)
+    await cache_client.cache(cache_key, movie.json())
+    generation = await cache_client.get_generation("movies")
+
+    await invalidate_cache("movies", [str(movie.id)])
+
+    assert await cache_client.get_entry(cache_key) is None
+    assert await cache_client.get_generation("movies") == generation + 1
+
+
+async def test_film_details_circuit_open(client: AsyncClient, cache_client: TwoTierCache, movie: Film):
+    breaker = get_breaker("movies")
+    for _ in range(breaker.min_calls):
+        breaker.record(False)
+    try:
+        response = await client.get("/films/-1")
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert "Retry-After" in response.headers
+
+        stale_entry = CacheEntry(data=movie.json().encode(), soft_expires_at=time.time() - 1)
+        await cache_client.set_entry(detail_key("movies", movie.id), stale_entry, ttl=60)
+        response = await client.get(f"/films/{movie.id}")
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["X-Degraded"] == "stale-cache"
+    finally:
+        breakers.pop("movies", None)
+
+
+async def test_film_details_deadline_exceeded(client: AsyncClient, cache_client: TwoTierCache, movie: Film):
+    try:
+        with patch.object(get_elastic(), "db", SlowElasticsearch()):
+            started = time.monotonic()
+            response = await client.get(f"/films/{movie.id}")
+    finally:
+        breakers.pop("movies", None)
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert time.monotonic() - started == pytest.approx(config.DETAILS_DEADLINE, abs=0.2)
+
+
+async def test_cache_warm_up(es_client: AsyncElasticsearch, cache_client: TwoTierCache, setup):
+    movies = [MovieFactory.create() for _ in range(5)]
+    await populate_es_from_factory(es_client=es_client, entities=movies, index="movies")
+    # The index holds films of other tests too: warm enough details to cover them all
+    with patch("src.core.config.WARMUP_TOP_FILMS", 1000):
+        await warm_up(app)
+
+    entries = await cache_client.get_entries([detail_key("movies", film.id) for film in movies])
+    assert [Film.parse_raw(entry.data) for entry in entries] == movies
+
+
+async def test_cache_warm_up_skips_catalog_lists(cache_client: TwoTierCache, setup):
+    warm_list = AsyncMock(return_value=HTTPStatus.OK)
+    with patch("src.core.config.WARMUP_LISTS", "/films/;/genres/"), patch(
+        "src.core.config.GENRE_CATALOG_ENABLED", True
+    ), patch("src.warmup.warm_list", warm_list):
+        await warm_up(app)
+
+    assert [call.args[1] for call in warm_list.await_args_list] == ["/v1/films/"]
+
+
+async def test_cache_warm_up_claimed_once(cache_client: TwoTierCache):
+    # Workers starting together race for the lock, the losers skip the warm-up
+    assert await claim_warm_up()
+    assert not await claim_warm_up()
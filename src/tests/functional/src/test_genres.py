@@ -0,0 +1,62 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from elasticsearch import AsyncElasticsearch
+from httpx import AsyncClient
+
+from src.db.elastic import get_elastic
+from src.services.genre_catalog import genre_catalog
+from src.tests.functional.factories import GenreFactory
+from src.tests.functional.utils.es_helpers import populate_es_from_factory
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def catalog(setup):
+    yield genre_catalog
+    genre_catalog.ready = False
+
+
+async def test_genres_from_catalog(client: AsyncClient, es_client: AsyncElasticsearch, catalog):
+    genres = {genre.id: genre for genre in (GenreFactory.create() for _ in range(5))}
+    await populate_es_from_factory(es_client=es_client, entities=list(genres.values()), index="genres")
+    await catalog.load(get_elastic())
+    # From here on genre reads must not reach ES
+    await es_client.indices.delete("genres")
+
+    response = await client.get("/genres/?limit=2")
+    assert response.status_code == HTTPStatus.OK
+    assert [item["id"] for item in response.json()] == sorted(genres)[:2]
+
+    response = await client.get("/genres/", params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+    assert [item["id"] for item in response.json()] == sorted(genres)[2:4]
+
+    genre = next(iter(genres.values()))
+    typo = genre.genre[:-1] + ("a" if genre.genre[-1] != "a" else "b")
+    response = await client.get("/genres/", params={"search_query": typo})
+    assert genre.id in [item["id"] for item in response.json()]
+
+    response = await client.get(f"/genres/{genre.id}")
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["genre"] == genre.genre
+
+
+async def test_genre_catalog_loads_in_background(es_client: AsyncElasticsearch, catalog):
+    genres = {genre.id: genre for genre in (GenreFactory.create() for _ in range(3))}
+    await populate_es_from_factory(es_client=es_client, entities=list(genres.values()), index="genres")
+
+    # Startup doesn't wait for the load: genres are read from ES until the catalog is ready
+    catalog.start(get_elastic())
+    try:
+        assert not catalog.ready
+        for _ in range(100):
+            if catalog.ready:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await catalog.stop()
+
+    assert catalog.ready
+    assert {str(genre_id) for genre_id in genres} <= set(catalog.genres)
@@ -0,0 +1,100 @@
+import asyncio
+import uuid
+from http import HTTPStatus
+
+import pytest
+from httpx import AsyncClient
+from starlette.responses import PlainTextResponse
+
+from src.core import metrics
+from src.core.middleware import AdmissionMiddleware
+from src.db import redis
+from src.services.rate_limit import TokenBucketLimiter
+
+# All test coroutines will be treated as marked.
+pytestmark = pytest.mark.asyncio
+
+
+def slow_app(seconds: float):
+    async def app(scope, receive, send):
+        await asyncio.sleep(seconds)
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    return app
+
+
+async def test_admission_sheds_when_queue_full():
+    middleware = AdmissionMiddleware(slow_app(0.1), max_in_flight=1, queue_size=0, queue_timeout=1)
+    shed = metrics.HTTP_SHED.labels("queue_full")
+    shed_before = shed.value
+
+    async with AsyncClient(app=middleware, base_url="http://test") as client:
+        responses = await asyncio.gather(client.get("/"), client.get("/"))
+
+    assert sorted(response.status_code for response in responses) == [HTTPStatus.OK, HTTPStatus.SERVICE_UNAVAILABLE]
+    rejected = next(response for response in responses if response.status_code == HTTPStatus.SERVICE_UNAVAILABLE)
+    assert rejected.headers["Retry-After"] == "1"
+    assert shed.value == shed_before + 1
+    assert middleware.active == 0
+
+
+async def test_admission_queue_timeout():
+    middleware = AdmissionMiddleware(slow_app(0.2), max_in_flight=1, queue_size=2, queue_timeout=0.05)
+    shed = metrics.HTTP_SHED.labels("queue_timeout")
+    shed_before = shed.value
+
+    async with AsyncClient(app=middleware, base_url="http://test") as client:
+        responses = await asyncio.gather(*(client.get("/") for _ in range(3)))
+
+    assert [response.status_code for response in responses].count(HTTPStatus.SERVICE_UNAVAILABLE) == 2
+    assert shed.value == shed_before + 2
+    assert middleware.active == 0
+    assert not middleware.waiters
+
+
+async def test_admission_release_skips_timed_out_waiter():
+    middleware = AdmissionMiddleware(slow_app(0), max_in_flight=1, queue_size=1, queue_timeout=1)
+    assert await middleware._admit() is None
+    waiting = asyncio.ensure_future(middleware._admit())
+    await asyncio.sleep(0)
+
+    # A timed out waiter is cancelled at once but leaves the queue only when its task resumes;
+    # a release in between must not hand it the slot
+    middleware.waiters[0].cancel()
+    middleware._release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert middleware.active == 0
+    assert not middleware.waiters
+
+
+async def test_admission_timeouts_under_load():
+    middleware = AdmissionMiddleware(slow_app(0), max_in_flight=2, queue_size=1000, queue_timeout=0.001)
+
+    async def request():
+        if await middleware._admit() is None:
+            await asyncio.sleep(0.001)
+            middleware._release()
+
+    # Releases keep landing between waiters timing out and resuming: no slot may leak
+    await asyncio.gather(*(request() for _ in range(3000)))
+
+    assert middleware.active == 0
+    assert not middleware.waiters
+
+
+async def test_token_bucket(setup):
+    limiter = TokenBucketLimiter(redis.redis, rate=10, burst=2, prefix=f"test-ratelimit:{uuid.uuid4().hex}")
+    # After a Redis restart the script cache is empty: the first call loads the script with EVAL
+    await redis.redis.script_flush()
+
+    assert await limiter.take("client") == 0
+    assert await limiter.take("client") == 0
+    retry_after = await limiter.take("client")
+    assert 0 < retry_after <= 0.1
+    # Every client has a bucket of its own
+    assert await limiter.take("other") == 0
+
+    await asyncio.sleep(retry_after + 0.01)
+    assert await limiter.take("client") == 0
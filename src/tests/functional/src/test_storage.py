@@ -0,0 +1,67 @@
+import asyncio
+import time
+from typing import Optional
+from unittest.mock import patch
+
+import pytest
+
+from src.core import deadline, metrics
+from src.services.base_storage import ElasticsearchStorage
+from src.services.circuit_breaker import breakers
+from src.tests.functional.utils.es_helpers import SlowElasticsearch
+
+# All test coroutines will be treated as marked.
+pytestmark = pytest.mark.asyncio
+
+
+class StuckPrimaryElasticsearch:
+    """The first read hangs on a stuck shard copy, the hedged one is answered at once."""
+
+    def __init__(self):
+        self.preferences = []
+        self.primary_cancelled = asyncio.Event()
+
+    async def get(self, index: str, id: str, preference: Optional[str] = None, request_timeout: float = None):
+        self.preferences.append(preference)
+        if preference is None:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.primary_cancelled.set()
+                raise
+        return {"_id": id, "_source": {"id": id}, "found": True}
+
+
+async def test_get_scalar_stops_at_deadline():
+    db = SlowElasticsearch()
+    storage = ElasticsearchStorage(db)
+    deadline.set_deadline(0.5)
+    started = time.monotonic()
+    try:
+        with pytest.raises(deadline.DeadlineExceeded):
+            await storage.get_scalar("1", "deadline_test")
+    finally:
+        breakers.pop("deadline_test", None)
+
+    # One attempt given the whole budget as its client timeout, no retry past the deadline
+    assert time.monotonic() - started == pytest.approx(0.5, abs=0.1)
+    assert len(db.timeouts) == 1
+    assert db.timeouts[0] == pytest.approx(0.5, abs=0.05)
+
+
+@patch("src.core.config.ES_HEDGE_ENABLED", True)
+async def test_get_scalar_hedged():
+    db = StuckPrimaryElasticsearch()
+    hedge_won = metrics.ES_HEDGES.labels("hedge_test", "hedge_won")
+    won = hedge_won.value
+    started = time.monotonic()
+
+    document = await ElasticsearchStorage(db).get_scalar("1", "hedge_test")
+
+    assert document["_id"] == "1"
+    assert time.monotonic() - started < 1
+    assert db.preferences[0] is None
+    assert db.preferences[1] is not None
+    # The losing primary read is cancelled, not left running in the background
+    await asyncio.wait_for(db.primary_cancelled.wait(), 1)
+    assert hedge_won.value == won + 1
@@ -0,0 +1,45 @@
+from http import HTTPStatus
+
+import pytest
+from elasticsearch import AsyncElasticsearch
+from httpx import AsyncClient
+
+from src.tests.functional.factories import GenreFactory, MovieFactory, PersonFactory
+from src.tests.functional.utils.es_helpers import populate_es_from_factory
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_suggest(client: AsyncClient, es_client: AsyncElasticsearch):
+    movie, person = MovieFactory.create(), PersonFactory.create()
+    await populate_es_from_factory(es_client=es_client, entities=[movie], index="movies")
+    await populate_es_from_factory(es_client=es_client, entities=[GenreFactory.create()], index="genres")
+    await populate_es_from_factory(es_client=es_client, entities=[person], index="people")
+
+    response = await client.get(f"/suggest/?query={movie.title[:3]}")
+    resp_json = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert {"id": str(movie.id), "type": "film", "title": movie.title} in resp_json
+
+    response = await client.get(f"/suggest/?query={person.last_name}")
+    assert str(person.id) in [item["id"] for item in response.json() if item["type"] == "person"]
+
+
+async def test_suggest_film_by_title_only(client: AsyncClient, es_client: AsyncElasticsearch):
+    titled, other = MovieFactory.create(), MovieFactory.create()
+    titled.title, other.title = "Zzyzx Road", "Quiet Days"
+    await populate_es_from_factory(es_client=es_client, entities=[titled, other], index="movies")
+    # Film documents also carry a flat genre field, the one film search matches with genre^3
+    await es_client.update(index="movies", id=other.id, body={"doc": {"genre": "Zzyzx"}}, refresh="wait_for")
+
+    response = await client.get("/suggest/?query=zzy")
+    films = [item["id"] for item in response.json() if item["type"] == "film"]
+
+    assert response.status_code == HTTPStatus.OK
+    assert films == [str(titled.id)]
+
+
+async def test_suggest_limit_capped(client: AsyncClient):
+    response = await client.get("/suggest/?query=a&limit=1000")
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
@@ -1,11 +1,15 @@
 import asyncio
+from typing import Optional
 
 from elasticsearch import AsyncElasticsearch
+from elasticsearch.exceptions import ConnectionTimeout
 
 
-async def populate_es_from_factory(es_client: AsyncElasticsearch, entities: list, index: str):
+async def populate_es_from_factory(
+    es_client: AsyncElasticsearch, entities: list, index: str, mappings: Optional[dict] = None
+):
     await es_client.indices.delete(index, ignore=[400, 404])
-    await es_client.indices.create(index)
+    await es_client.indices.create(index, body={"mappings": mappings} if mappings else None)
 
     body = []
     for entity in entities:
@@ -14,3 +18,15 @@ async def populate_es_from_factory(es_client: AsyncElasticsearch, entities: list
 
     await es_client.bulk(index=index, doc_type="doc", body=body)
     await asyncio.sleep(0.5)
+
+
+class SlowElasticsearch:
+    """Answers no read before the client request timeout runs out, like an overloaded node."""
+
+    def __init__(self):
+        self.timeouts = []
+
+    async def get(self, index: str, id: str, preference: Optional[str] = None, request_timeout: float = None):
+        self.timeouts.append(request_timeout)
+        await asyncio.sleep(request_timeout)
+        raise ConnectionTimeout("TIMEOUT", "read timed out", asyncio.TimeoutError())
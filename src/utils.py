@@ -1,46 +1,385 @@
+import asyncio
+import base64
+import inspect
+import logging
+import zlib
 from functools import wraps
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 
 import orjson
+from fastapi import HTTPException, Request, Response
 
-from src.db.redis import get_redis
+from src.core import config, deadline, metrics, request_trace
+from src.db.redis import get_cache
+from src.services.base_cache import CACHE_ERRORS, CacheEntry
+from src.services.cache_keys import KEY_PARAM_TYPES, detail_key, list_key
+from src.services.circuit_breaker import CircuitOpenError, is_degraded
+
+logger = logging.getLogger(__name__)
 
 
 def orjson_dumps(v, *, default):
     return orjson.dumps(v, default=default).decode()
 
 
-def cached(decoder, many: bool = False):
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one shared future."""
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]):
+        if (call := self._calls.get(key)) is not None:
+            return await asyncio.shield(call)
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        try:
+            rv = await fn()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except Exception as exc:
+            call.set_exception(exc)
+            # Followers re-raise it themselves; don't warn when there are none.
+            call.exception()
+            raise
+        else:
+            call.set_result(rv)
+            return rv
+        finally:
+            del self._calls[key]
+
+
+single_flight = SingleFlight()
+_background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro: Awaitable) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def keyset_sort(sort_field: str, sort_order: str, tiebreaker: str = "id") -> list[str]:
+    sort = [f"{sort_field}:{sort_order}"]
+    if sort_field != tiebreaker:
+        sort.append(f"{tiebreaker}:{sort_order}")
+    return sort
+
+
+def encode_cursor(sort: list[str], search_after: list) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps({"sort": sort, "after": search_after})).decode()
+
+
+def decode_cursor(cursor: str, sort: list[str]) -> list:
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="invalid cursor")
+    if not isinstance(payload, dict) or payload.get("sort") != sort or not isinstance(payload.get("after"), list):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="cursor does not match sort parameters")
+    return payload["after"]
+
+
+def json_response(body: bytes, headers: Optional[dict[str, str]] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def ndjson_stream(pages: AsyncIterator[list[dict]], compress: bool = False) -> AsyncIterator[bytes]:
+    """Encodes each page of rows as one NDJSON chunk, gzipped on the fly if asked.
+
+    Only the page being written is held in memory, so the stream stays flat whatever its length.
+    """
+    compressor = zlib.compressobj(config.EXPORT_COMPRESSION_LEVEL, zlib.DEFLATED, 31) if compress else None
+    async for rows in pages:
+        chunk = b"".join(orjson.dumps(row) + b"\n" for row in rows)
+        if compressor is None:
+            yield chunk
+        else:
+            # A sync flush per page lets the client decode rows as they arrive
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def _wait_for_peer(cache, cache_key: str) -> Optional[CacheEntry]:
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + config.CACHE_LOCK_LEASE_MS / 1000
+    while loop.time() < give_up_at:
+        await asyncio.sleep(config.CACHE_LOCK_POLL_MS / 1000)
+        try:
+            if (entry := await cache.get_entry(cache_key)) is not None:
+                return entry
+        except CACHE_ERRORS:
+            return None
+    return None
+
+
+async def _release(cache, cache_key: str, locked: Optional[bool]):
+    if not locked:
+        return
+    try:
+        await cache.release_lock(cache_key)
+    except CACHE_ERRORS:
+        # The lease expires on its own
+        logger.warning("Failed to release cache lock for %s", cache_key, exc_info=True)
+
+
+# Marks a stale cached response served because storage is unavailable
+DEGRADED_HEADER = "X-Degraded"
+
+
+def etag_matches(if_none_match: str, etag: Optional[str]) -> bool:
+    # Weak comparison (RFC 7232): nginx turns the ETags of responses it gzips into weak ones
+    if not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def count_cache(namespace: str, result: str):
+    metrics.CACHE_REQUESTS.labels(namespace, result).inc()
+    request_trace.record_cache(result)
+
+
+def cached(
+    namespace: str,
+    many: bool = False,
+    ttl: Optional[int] = None,
+    soft_ttl: int = 0,
+    max_age: int = 0,
+    bypass: Optional[Callable[[dict], bool]] = None,
+):
+    """Caches the endpoint response body and serves cache hits as raw bytes.
+
+    Cached bytes are already a valid JSON body, so hits skip model construction,
+    response_model validation and re-serialization.
+
+    Lists are keyed by the namespace (index) generation and a hash of the normalized
+    query params, details by the namespace and the entity id.
+
+    Responses carry the entry ETag and, with max_age, a Cache-Control header. A matching
+    If-None-Match is answered with 304 from the entry meta alone, the body is never read.
+
+    ``bypass`` is called with the endpoint kwargs; when it returns True the endpoint has a
+    source faster than the shared cache and is called directly, with the same headers.
+    """
+
     def decorator(func):
-        @wraps(func)
-        async def decorated_function(*args, **kwargs):
-            cache = get_redis()
+        signature = inspect.signature(func)
+        defaults = {name: param.default for name, param in signature.parameters.items()}
+        # The wrapper needs the request for If-None-Match even when the endpoint itself doesn't
+        pass_request = "request" in signature.parameters
+        cache_control = {"Cache-Control": f"public, max-age={max_age}"} if max_age else {}
+
+        async def build_key(cache, kwargs: dict) -> str:
             if many:
-                cache_key = (
-                    f"{kwargs['search_query']}:{kwargs['sort_order'].lower()}:{kwargs['sort'].lower()}:"
-                    f"{kwargs['page']}:{kwargs['limit']}"
-                )
-            else:
-                _, entity = kwargs.items()
-                entity_title, _ = entity[0].split("_")
-                cache_key = f"{entity_title}:{entity[1]}"
-            rv = await cache.get_from_cache(cache_key)
-
-            if rv is not None:
-                if many:
-                    entities = orjson.loads(rv)
-                    if not entities:
-                        return []
-                    return entities
-                return decoder.parse_raw(rv)
-
-            rv = await func(*args, **kwargs)
+                params = {name: value for name, value in kwargs.items() if isinstance(value, KEY_PARAM_TYPES)}
+                return list_key(namespace, await cache.get_generation(namespace), params, defaults)
+            entity_id = next(value for name, value in kwargs.items() if name.endswith("_id"))
+            return detail_key(namespace, entity_id)
+
+        def render(rv) -> CacheEntry:
+            headers = {}
             if many:
-                await cache.cache(cache_key, orjson.dumps([entity.dict() for entity in rv]))
+                items = [entity.dict() for entity in rv]
+                if next_cursor := getattr(rv, "next_cursor", None):
+                    headers["X-Next-Cursor"] = next_cursor
+                if (total := getattr(rv, "total", None)) and total["relation"] == "eq":
+                    headers["X-Total-Count"] = str(total["value"])
+                if (facets := getattr(rv, "facets", None)) is not None:
+                    # Facets are cached with the hits, under the same key
+                    data = orjson.dumps({"total": total, "items": items, "facets": facets})
+                else:
+                    data = orjson.dumps(items)
             else:
-                await cache.cache(cache_key, rv.json())
+                data = rv.json()
+            return CacheEntry.create(data, soft_ttl, headers)
 
-            return rv
+        async def load(cache, cache_key: str, *args, revalidate: bool = False, **kwargs):
+            locked = False
+            if config.CACHE_LOCK_ENABLED:
+                try:
+                    locked = await cache.acquire_lock(cache_key, config.CACHE_LOCK_LEASE_MS)
+                except CACHE_ERRORS:
+                    logger.warning("Failed to acquire cache lock for %s", cache_key, exc_info=True)
+                    locked = None
+                if locked is False:
+                    # Another worker is recomputing this key.
+                    if revalidate:
+                        return None
+                    if (entry := await _wait_for_peer(cache, cache_key)) is not None:
+                        return entry
+
+            try:
+                entry = render(await func(*args, **kwargs))
+            except Exception:
+                await _release(cache, cache_key, locked)
+                raise
+
+            try:
+                await cache.set_entry(cache_key, entry, ttl or config.CACHE_TTL)
+            except CACHE_ERRORS:
+                count_cache(namespace, "error")
+                logger.warning("Failed to cache %s", cache_key, exc_info=True)
+            await _release(cache, cache_key, locked)
+            return entry
+
+        async def revalidate(cache, cache_key: str, *args, **kwargs):
+            # Runs in a copy of the request context, whose deadline is about to pass
+            deadline.restart()
+            try:
+                await single_flight.do(
+                    f"revalidate:{cache_key}", lambda: load(cache, cache_key, *args, revalidate=True, **kwargs)
+                )
+            except CircuitOpenError:
+                logger.debug("Storage circuit open, keeping stale %s", cache_key)
+            except deadline.DeadlineExceeded:
+                logger.warning("Revalidation of %s ran out of time, keeping stale", cache_key)
+            except Exception:
+                logger.exception("Failed to revalidate cache key %s", cache_key)
+
+        @wraps(func)
+        async def decorated_function(*args, **kwargs):
+            request: Request = kwargs["request"] if pass_request else kwargs.pop("request")
+            if_none_match = request.headers.get("if-none-match")
+
+            def respond(entry: CacheEntry, degraded: bool = False) -> Response:
+                headers = {**entry.headers, **cache_control}
+                if degraded:
+                    headers[DEGRADED_HEADER] = "stale-cache"
+                if if_none_match and etag_matches(if_none_match, entry.etag):
+                    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+                return json_response(entry.data, headers)
 
+            def serve_cached(entry: CacheEntry, result: str) -> Response:
+                count_cache(namespace, "stale" if entry.is_stale else result)
+                if entry.is_stale and not single_flight.in_flight(f"revalidate:{cache_key}"):
+                    # While the breaker is open this fails fast; once it half-opens it is the probe
+                    run_in_background(revalidate(cache, cache_key, *args, **kwargs))
+                return respond(entry, degraded=entry.is_stale and is_degraded(namespace))
+
+            # A profiled request must reach storage to have anything to profile
+            if (bypass is not None and bypass(kwargs)) or request_trace.profiling():
+                count_cache(namespace, "bypass")
+                return respond(render(await func(*args, **kwargs)))
+
+            cache = get_cache()
+            try:
+                cache_key = await build_key(cache, kwargs)
+                if if_none_match and (meta := await cache.get_meta(cache_key)) is not None:
+                    if etag_matches(if_none_match, meta.etag):
+                        return serve_cached(meta, "not_modified")
+                entry = await cache.get_entry(cache_key)
+            except CACHE_ERRORS:
+                # Cache outage must not take the endpoint down: answer straight from storage
+                count_cache(namespace, "error")
+                logger.warning("Cache lookup failed for %s", func.__name__, exc_info=True)
+                return respond(render(await func(*args, **kwargs)))
+
+            if entry is not None:
+                return serve_cached(entry, "hit")
+
+            count_cache(namespace, "miss")
+            entry = await single_flight.do(cache_key, lambda: load(cache, cache_key, *args, **kwargs))
+            return respond(entry)
+
+        if not pass_request:
+            request_param = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+            decorated_function.__signature__ = signature.replace(
+                parameters=[*signature.parameters.values(), request_param]
+            )
         return decorated_function
 
     return decorator
+
+
+# Detail keys a batch is revalidating, so overlapping batches don't fetch them again
+_revalidating: set[str] = set()
+
+
+async def _revalidate_batch(namespace: str, entity_ids: list[str], service, ttl: Optional[int], soft_ttl: int):
+    keys = [detail_key(namespace, entity_id) for entity_id in entity_ids]
+    # Runs in a copy of the request context, whose deadline is about to pass
+    deadline.restart()
+    try:
+        fetched = {}
+        for key, model in zip(keys, await service.get_many(entity_ids)):
+            if model is not None:
+                fetched[key] = CacheEntry.create(model.json(), soft_ttl)
+        await get_cache().set_entries(fetched, ttl or config.CACHE_TTL)
+    except CircuitOpenError:
+        logger.debug("Storage circuit open, keeping stale %s batch", namespace)
+    except deadline.DeadlineExceeded:
+        logger.warning("Revalidation of %s batch ran out of time, keeping stale", namespace)
+    except Exception:
+        logger.exception("Failed to revalidate %s batch", namespace)
+    finally:
+        _revalidating.difference_update(keys)
+
+
+async def cached_batch(namespace: str, entity_ids: list[str], service, ttl: Optional[int] = None, soft_ttl: int = 0):
+    """Looks up details for many ids with one cache round trip and one storage call for the misses.
+
+    Shares cache entries with the detail endpoint, keeps request order and marks unknown ids as not found.
+    Entries past their soft TTL are served and revalidated in the background with one storage call.
+    """
+    cache = get_cache()
+    keys = [detail_key(namespace, entity_id) for entity_id in entity_ids]
+    try:
+        found = dict(zip(keys, await cache.get_entries(keys)))
+    except CACHE_ERRORS:
+        # Cache outage must not take the endpoint down: every id is read from storage
+        count_cache(namespace, "error")
+        logger.warning("Cache lookup failed for %s batch", namespace, exc_info=True)
+        found = dict.fromkeys(keys)
+
+    stale = [
+        entity_id
+        for entity_id, key in zip(entity_ids, keys)
+        if (entry := found[key]) is not None
+        and entry.is_stale
+        and key not in _revalidating
+        and not single_flight.in_flight(f"revalidate:{key}")
+    ]
+    if stale:
+        # Stale entries are served as they are and refreshed in the background, like cached() does
+        stale = list(dict.fromkeys(stale))
+        _revalidating.update(detail_key(namespace, entity_id) for entity_id in stale)
+        run_in_background(_revalidate_batch(namespace, stale, service, ttl, soft_ttl))
+
+    if missing := [entity_id for entity_id, key in zip(entity_ids, keys) if found[key] is None]:
+        missing = list(dict.fromkeys(missing))
+        fetched = {}
+        for entity_id, model in zip(missing, await service.get_many(missing)):
+            if model is not None:
+                fetched[detail_key(namespace, entity_id)] = CacheEntry.create(model.json(), soft_ttl)
+        try:
+            await cache.set_entries(fetched, ttl or config.CACHE_TTL)
+        except CACHE_ERRORS:
+            count_cache(namespace, "error")
+            logger.warning("Failed to cache %s batch", namespace, exc_info=True)
+        found.update(fetched)
+
+    items = []
+    for entity_id, key in zip(entity_ids, keys):
+        if (entry := found[key]) is None:
+            items.append(orjson.dumps({"id": entity_id, "found": False, "data": None}))
+        else:
+            items.append(orjson.dumps({"id": entity_id, "found": True})[:-1] + b',"data":' + entry.data + b"}")
+    return json_response(b"[" + b",".join(items) + b"]")
+
+
+async def invalidate_cache(namespace: str, entity_ids: Optional[list[str]] = None):
+    """Drops all cached lists of the namespace by bumping its generation and the given details."""
+    cache = get_cache()
+    await cache.bump_generation(namespace)
+    if entity_ids:
+        await cache.delete(*(detail_key(namespace, entity_id) for entity_id in entity_ids))
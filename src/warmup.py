@@ -0,0 +1,169 @@
+"""Cache warm-up after a deploy or a Redis failover.
+
+The configured list requests are replayed in process through the API router, so they are
+cached under the very keys clients hit. Details of the top rated films and of the people in
+them are read with a few batched ES queries and written with pipelined cache writes.
+Genre lists are left out while the in-process genre catalog answers them.
+
+At startup only the worker that claims the warm-up lock runs it; the CLI always does.
+
+    python -m src.warmup
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from fastapi import FastAPI
+
+from src.core import config
+from src.db.elastic import get_elastic
+from src.db.redis import get_cache
+from src.models.film import Film
+from src.services.base_cache import CACHE_ERRORS, CacheEntry
+from src.services.cache_keys import detail_key
+from src.services.film import get_film_service
+from src.services.person import get_person_service
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LOCK_KEY = "warmup"
+
+
+def parse_lists(spec: str) -> list[tuple[str, str]]:
+    """Splits WARMUP_LISTS ("/films/?view=summary;/genres/") into (path, query string) pairs."""
+    requests = []
+    for item in spec.split(";"):
+        if item := item.strip():
+            path, _, query = item.partition("?")
+            requests.append((config.API_V1_PREFIX + path, query))
+    return requests
+
+
+def skip_list(path: str) -> bool:
+    # The genre catalog bypasses the shared cache, a cached genre list would never be read
+    return config.GENRE_CATALOG_ENABLED and path.startswith(f"{config.API_V1_PREFIX}/genres/")
+
+
+async def claim_warm_up() -> bool:
+    """Takes the warm-up lock, so that of the workers starting together only one warms the cache.
+
+    The lock is never released: it expires after WARMUP_LOCK_TTL, and a worker restarted later
+    warms the cache again. Without Redis there is nothing to warm.
+    """
+    try:
+        return await get_cache().acquire_lock(WARMUP_LOCK_KEY, int(config.WARMUP_LOCK_TTL * 1000))
+    except CACHE_ERRORS:
+        logger.warning("Failed to take the cache warm-up lock, skipping the warm-up", exc_info=True)
+        return False
+
+
+async def warm_list(app: FastAPI, path: str, query: str) -> int:
+    """Runs a GET through the router (no middleware, no socket) and returns its status."""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [],
+        "client": None,
+        "server": None,
+        "app": app,
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app.router(scope, receive, send)
+    return status
+
+
+async def warm_details(top: int, batch_size: int, limiter: asyncio.Semaphore) -> int:
+    cache = get_cache()
+    film_service = get_film_service(get_elastic())
+    person_service = get_person_service(get_elastic())
+
+    # One search brings the whole top with full documents, ready to be cached as details
+    query = {"size": top, "from": 0, "sort": ["rating:desc", "id:desc"], "_source": list(Film.__fields__)}
+    async with limiter:
+        films = await film_service.list(query)
+    person_ids = list(dict.fromkeys(str(person.id) for film in films for person in film.people))
+
+    async def write(entries: dict[str, CacheEntry], ttl: int) -> int:
+        # A busy pool rejects the pipeline checkout (PoolWaitQueueFull): skip the chunk, not the warm-up
+        try:
+            await cache.set_entries(entries, ttl)
+        except CACHE_ERRORS:
+            logger.warning("Cache warm-up failed to write %d entries", len(entries), exc_info=True)
+            return 0
+        return len(entries)
+
+    written = 0
+    for start in range(0, len(films), batch_size):
+        entries = {
+            detail_key("movies", film.id): CacheEntry.create(film.json(), config.FILMS_CACHE_SOFT_TTL)
+            for film in films[start : start + batch_size]
+        }
+        written += await write(entries, config.FILMS_CACHE_TTL)
+
+    async def warm_people(ids: list[str]) -> int:
+        async with limiter:
+            people = await person_service.get_many(ids)
+        entries = {
+            detail_key("people", person_id): CacheEntry.create(person.json(), config.PEOPLE_CACHE_SOFT_TTL)
+            for person_id, person in zip(ids, people)
+            if person is not None
+        }
+        return await write(entries, config.PEOPLE_CACHE_TTL)
+
+    batches = [person_ids[start : start + batch_size] for start in range(0, len(person_ids), batch_size)]
+    return written + sum(await asyncio.gather(*(warm_people(ids) for ids in batches)))
+
+
+async def warm_up(app: FastAPI):
+    """Warms the cache, logging rather than raising: a cold cache must never stop the app."""
+    started = time.perf_counter()
+    limiter = asyncio.Semaphore(config.WARMUP_CONCURRENCY)
+
+    async def warm(path: str, query: str) -> int:
+        # Each request runs in its own task (gather), so its deadline stays in its own context
+        async with limiter:
+            return await warm_list(app, path, query)
+
+    lists = [(path, query) for path, query in parse_lists(config.WARMUP_LISTS) if not skip_list(path)]
+    results = await asyncio.gather(
+        *(warm(path, query) for path, query in lists),
+        warm_details(config.WARMUP_TOP_FILMS, config.WARMUP_BATCH_SIZE, limiter),
+        return_exceptions=True,
+    )
+    for (path, query), status in zip(lists, results):
+        if isinstance(status, Exception) or status != 200:
+            logger.warning("Cache warm-up of %s?%s failed: %r", path, query, status)
+    details: Optional[int] = results[-1] if not isinstance(results[-1], Exception) else None
+    if details is None:
+        logger.warning("Cache warm-up of details failed", exc_info=results[-1])
+    logger.info("Cache warm-up: %d lists, %s details in %.2fs", len(lists), details, time.perf_counter() - started)
+
+
+async def main():
+    from src.main import app, shutdown, startup
+
+    await startup()
+    try:
+        await warm_up(app)
+    finally:
+        await shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())